@@ -14,6 +14,7 @@ interface User {
   rollNo?: string
   class?: string
   age?: number
+  department?: string
   quizAttempts?: number
 }
 
@@ -44,6 +44,7 @@ export function StudentQuiz() {
   const [isGenerating, setIsGenerating] = useState(false)
   const [generationError, setGenerationError] = useState(false)
   const [questions, setQuestions] = useState<QuizQuestion[]>([])
+  const [quizId, setQuizId] = useState<string | null>(null)
   const [showConfigDialog, setShowConfigDialog] = useState(false)
   const [quizConfig, setQuizConfig] = useState<QuizConfig>({
     age: user?.age || 10,
@@ -142,6 +143,7 @@ export function StudentQuiz() {
 
       const data = await res.json()
       setQuestions(data.questions)
+      setQuizId(data.quizId)
       console.log("Quiz questions loaded:", data.questions.length)
       showSuccessToast("Quiz generated successfully!")
     } catch (err: any) {
@@ -210,8 +212,8 @@ export function StudentQuiz() {
         },
         body: JSON.stringify({ 
           userId: user?.id,
-          answers: answers,
-          questions 
+          quizId,
+          answers: answers
         }),
       })
 
@@ -467,6 +469,7 @@ export function StudentQuiz() {
                 setGenerationError(false)
                 setQuizStarted(false)
                 setQuestions([])
+                setQuizId(null)
               }} 
               className="w-full max-w-xs"
             >
@@ -535,6 +538,7 @@ export function StudentQuiz() {
                 setCurrentQuestion(0)
                 setAnswers([])
                 setQuestions([])
+                setQuizId(null)
                 window.location.reload()
               }} 
               className="w-full"
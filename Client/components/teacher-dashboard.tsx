@@ -73,6 +73,84 @@ export function TeacherDashboard() {
     }
   }, [user])
 
+  // Live updates: EventSource can't send Authorization, so the stream is opened
+  // with a short-lived token and reopened with a fresh one when it is closed.
+  useEffect(() => {
+    if (user?.role !== "teacher" || !user?.department) return
+
+    let source: EventSource | null = null
+    let lastEventId = ""
+    let retryTimer: ReturnType<typeof setTimeout> | undefined
+    let closed = false
+
+    const open = async () => {
+      try {
+        const res = await fetch(`${backendURL}/quiz/submissions/stream-token`, {
+          method: "POST",
+          headers: {
+            Authorization: `Bearer ${localStorage.getItem("auth_token")}`,
+          },
+        })
+        if (!res.ok || closed) return
+        const { token } = await res.json()
+        const params = new URLSearchParams({ token })
+        if (lastEventId) params.set("lastEventId", lastEventId)
+        source = new EventSource(`${backendURL}/quiz/submissions/stream?${params}`)
+
+        source.addEventListener("submission", (e) => {
+          const event = JSON.parse((e as MessageEvent).data)
+          lastEventId = (e as MessageEvent).lastEventId || lastEventId
+          if (event.op === "insert") {
+            // Inserts carry the whole row, so the list is patched, not refetched
+            const { op, submissionId, riskLabel, changedFields, department, ...row } = event
+            setSubmissions((current) =>
+              current.some((s) => s._id === submissionId)
+                ? current
+                : [{ _id: submissionId, ...row } as QuizSubmission, ...current],
+            )
+            return
+          }
+          setSubmissions((current) =>
+            current.map((s) =>
+              s._id === event.submissionId
+                ? {
+                    ...s,
+                    status: event.status ?? s.status,
+                    score: event.score ?? s.score,
+                    reviewedAt: event.reviewedAt ?? s.reviewedAt,
+                    completedAt: event.completedAt ?? s.completedAt,
+                  }
+                : s,
+            ),
+          )
+        })
+        // The server could not resume from our last id (e.g. its history rolled
+        // over): the reset event cleared Last-Event-ID, reload the list once
+        source.addEventListener("reset", () => {
+          lastEventId = ""
+          fetchSubmissions()
+        })
+        source.onerror = () => {
+          // The browser retries on its own unless the request was rejected
+          // (expired token, 503 without a replica set); then start over.
+          if (source?.readyState === EventSource.CLOSED && !closed) {
+            retryTimer = setTimeout(open, 5000)
+          }
+        }
+      } catch (err) {
+        console.error("Failed to open submission stream:", err)
+        if (!closed) retryTimer = setTimeout(open, 5000)
+      }
+    }
+
+    open()
+    return () => {
+      closed = true
+      clearTimeout(retryTimer)
+      source?.close()
+    }
+  }, [user])
+
   const fetchSubmissions = async () => {
     setLoadingSubmissions(true)
     try {
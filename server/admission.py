@@ -0,0 +1,205 @@
+"""
+Admission control for LLM-backed routes
+
+Each request to an LLM route must pass, in order:
+
+    1. the caller's token bucket       (ADMISSION_USER_RATE per minute, burst ADMISSION_USER_BURST)
+    2. the department's token bucket   (ADMISSION_DEPARTMENT_RATE per minute, burst ADMISSION_DEPARTMENT_BURST)
+    3. a global in-flight cap          (LLM_MAX_IN_FLIGHT concurrent calls)
+
+Empty buckets fail fast with 429 and a Retry-After for when the next token
+arrives. When all in-flight slots are taken the request waits in a bounded
+queue (LLM_MAX_QUEUE) for at most LLM_QUEUE_TIMEOUT seconds, then fails
+with 503 and Retry-After; tokens of rejected requests are refunded.
+
+State is per worker process, so with N workers the effective limits are N
+times the configured ones.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Request
+
+from routes.get_user import get_current_user
+from settings import settings
+
+ADMISSION_USER_RATE = settings.admission_user_rate
+ADMISSION_USER_BURST = settings.admission_user_burst
+ADMISSION_DEPARTMENT_RATE = settings.admission_department_rate
+ADMISSION_DEPARTMENT_BURST = settings.admission_department_burst
+LLM_MAX_IN_FLIGHT = settings.llm_max_in_flight
+LLM_MAX_QUEUE = settings.llm_max_queue
+LLM_QUEUE_TIMEOUT = settings.llm_queue_timeout
+
+# Idle buckets are full anyway; keep memory bounded
+MAX_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Classic token bucket; ``rate`` tokens per second up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, cost: float = 1.0) -> float:
+        """Take ``cost`` tokens; returns 0 on success, else seconds until they are available"""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def refund(self, cost: float = 1.0):
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+
+class BucketPool:
+    """LRU-bounded token buckets keyed by user or department"""
+
+    def __init__(self, per_minute: float, burst: float, max_buckets: int = MAX_BUCKETS):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def get(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+
+class InFlightLimiter:
+    """Concurrency cap with a bounded FIFO wait queue and per-waiter deadline"""
+
+    def __init__(self, limit: int = LLM_MAX_IN_FLIGHT, max_queue: int = LLM_MAX_QUEUE):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+
+    async def acquire(self, timeout: float) -> bool:
+        """Take a slot, waiting up to ``timeout`` seconds; False if none became free"""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+            return True
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the deadline passed
+                return True
+            waiter.cancel()
+            return False
+        except asyncio.CancelledError:
+            # Client went away while queued; pass on a slot we were just given
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self):
+        # Hand the slot straight to the oldest live waiter
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+
+
+class AdmissionController:
+    """Token buckets plus in-flight cap; one instance per app (``app.admission``)"""
+
+    def __init__(self):
+        self.users = BucketPool(ADMISSION_USER_RATE, ADMISSION_USER_BURST)
+        self.departments = BucketPool(ADMISSION_DEPARTMENT_RATE, ADMISSION_DEPARTMENT_BURST)
+        self.in_flight = InFlightLimiter()
+        self.queue_timeout = LLM_QUEUE_TIMEOUT
+        self.rejected = {"user": 0, "department": 0, "capacity": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _retry_after(seconds: float) -> dict:
+        return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+    async def admit(self, user_id: str, department: Optional[str]):
+        """Raise 429/503 unless the request may proceed; the caller must release() on success"""
+        with self._lock:
+            user_bucket = self.users.get(user_id)
+            wait = user_bucket.try_take()
+            if wait:
+                self.rejected["user"] += 1
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many requests, please slow down",
+                    headers=self._retry_after(wait),
+                )
+            department_bucket = self.departments.get(department or "")
+            wait = department_bucket.try_take()
+            if wait:
+                user_bucket.refund()
+                self.rejected["department"] += 1
+                raise HTTPException(
+                    status_code=429,
+                    detail="Your class is sending too many requests, please retry shortly",
+                    headers=self._retry_after(wait),
+                )
+
+        if not await self.in_flight.acquire(self.queue_timeout):
+            with self._lock:
+                user_bucket.refund()
+                department_bucket.refund()
+                self.rejected["capacity"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail="The service is busy, please retry shortly",
+                headers=self._retry_after(self.queue_timeout),
+            )
+
+    def release(self):
+        self.in_flight.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "inFlight": self.in_flight.in_flight,
+            "queued": len(self.in_flight._waiters),
+            "limit": self.in_flight.limit,
+            "rejected": dict(self.rejected),
+        }
+
+
+async def llm_admission(request: Request, current_user: dict = Depends(get_current_user)):
+    """Route dependency admitting the current user to an LLM-backed route"""
+    controller: AdmissionController = request.app.admission
+    await controller.admit(str(current_user.get("id")), current_user.get("department"))
+    try:
+        yield
+    finally:
+        controller.release()
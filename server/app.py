@@ -1,29 +1,114 @@
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
-from pymongo import MongoClient
+from serialization import FastJSONResponse
 from contextlib import asynccontextmanager
-from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
-import os
+import asyncio
+import logging
+
+from settings import settings
+from logging_config import setup_logging, shutdown_logging
+from tracing import MongoCommandTracer, TracingMiddleware, shutdown_tracing
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def warm_ml_stack():
+    """
+    Import the NumPy/scikit-learn stack and load the model and drift reference
+
+    Runs in a worker thread so the event loop can serve requests meanwhile.
+    Under serve.py it has already run in the master before forking, so this
+    is a no-op that reuses the copy-on-write shared model.
+    """
+    from drift_monitor import get_drift_monitor, load_reference
+    from ml_service import get_model
+
+    get_model()
+    monitor = get_drift_monitor()
+    if monitor.reference is None and monitor.reference_error is None:
+        try:
+            monitor.set_reference(load_reference())
+        except Exception as e:
+            logger.warning("Drift reference unavailable: %s", e)
+
+
+async def run_ml_background():
+    await asyncio.to_thread(warm_ml_stack)
+
+    from drift_monitor import get_drift_monitor, run_drift_schedule
+
+    await run_drift_schedule(get_drift_monitor())
 
-load_dotenv()
 
 @asynccontextmanager
 async def app_lifespan(app: FastAPI):
-    app.mongodb_client = MongoClient(os.getenv("MONGODB_URI"))
-    app.database = app.mongodb_client[os.getenv("DEV_DATABASE")]
+    from pymongo import AsyncMongoClient, MongoClient
+
+    setup_logging()
+
+    # Mongo commands show up as client spans of the request that issued them
+    mongo_tracer = MongoCommandTracer()
+    app.mongodb_client = MongoClient(settings.mongodb_uri, event_listeners=[mongo_tracer])
+    app.database = app.mongodb_client[settings.database_name]
+    # Async client for long-lived change streams (submission feed)
+    app.async_mongodb_client = AsyncMongoClient(settings.mongodb_uri, event_listeners=[mongo_tracer])
+    app.async_database = app.async_mongodb_client[settings.database_name]
     # app.database = app.mongodb_client[env_settings.PROD_DATABASE]
+
+    import etags
+    import global_explanations
+    import idempotency
+
+    try:
+        idempotency.ensure_indexes(app.database)
+        etags.ensure_indexes(app.database)
+        global_explanations.ensure_indexes(app.database)
+    except Exception as e:
+        logger.warning("Index creation failed: %s", e)
+
+    from admission import AdmissionController
+
+    app.admission = AdmissionController()
+
+    # Candidate model scored in the background alongside the live one
+    app.shadow = None
+    if settings.shadow_model_path:
+        import shadow
+
+        shadow.ensure_indexes(app.database)
+        app.shadow = shadow.ShadowScorer(app.database)
+
+    from counters import CounterBuffer, run_flush_schedule
+
+    # Per-user counters (quizAttempts) are written behind the submit path
+    app.counters = CounterBuffer(app.database)
+    counter_task = asyncio.create_task(run_flush_schedule(app.counters))
+
+    ml_task = asyncio.create_task(run_ml_background())
     try:
         yield
     finally:
+        ml_task.cancel()
+        counter_task.cancel()
+        try:
+            await asyncio.to_thread(app.counters.flush)
+        except Exception:
+            logger.exception("Final counter flush failed")
+        if app.shadow is not None:
+            await asyncio.to_thread(app.shadow.shutdown)
         app.mongodb_client.close()
+        await app.async_mongodb_client.close()
+        shutdown_tracing()
+        shutdown_logging()
 
 app = FastAPI(
     title="IML Project API",
     description="FastAPI application for IML Project",
     swagger_ui_parameters={"defaultModelsExpandDepth": -1},
     version="0.1",
-    debug=True,
+    debug=settings.debug,
+    default_response_class=FastJSONResponse,
     lifespan=app_lifespan,
     # root_path="/api"
 )
@@ -35,7 +120,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # ETag so the cross-origin dashboard can send it back in If-None-Match
+    expose_headers=["traceparent", "ETag"],
 )
+# Outermost, so the server span covers CORS handling and the whole route
+app.add_middleware(TracingMiddleware)
 
 
 
@@ -45,9 +134,9 @@ async def health_check():
     Health check endpoint to verify API and database status
     """
     try:
-        return JSONResponse(content={"status": "ok"}, status_code=200)
+        return FastJSONResponse(content={"status": "ok"}, status_code=200)
     except Exception as e:
-        return JSONResponse(
+        return FastJSONResponse(
             content={"status": "error", "database": "disconnected", "detail": str(e)},
             status_code=503,
         )
@@ -55,18 +144,21 @@ async def health_check():
 # Include Routers
 from routes.auth import auth_router
 from routes.quiz import quiz_router
+from routes.ml import ml_router
 
 app.include_router(auth_router)
 app.include_router(quiz_router)
+app.include_router(ml_router)
 
 
 if __name__ == "__main__":
+    # Development server; use serve.py for multi-worker production deployments
     import uvicorn
 
     uvicorn.run(
         "app:app",
         host="0.0.0.0",
-        port=os.getenv("PORT"),
-        reload=True,
+        port=settings.port,
+        reload=settings.debug,
         # log_level="info"
     )
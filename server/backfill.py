@@ -0,0 +1,209 @@
+"""
+Re-score historical quiz submissions after a model change
+
+Splits ``quiz_submissions`` into contiguous _id ranges of --chunk-size
+documents and hands them to a process pool. Each worker streams its range,
+re-runs feature extraction (from the compact ``responses`` against the
+stored quiz, or from the stored mlAnalytics for older documents), scores
+the whole batch with one predict_proba call, and writes the new
+mlPrediction back with an unordered bulk_write tagged with the model
+version. Documents already scored by the current model version are skipped,
+and finished ranges are recorded in a checkpoint file, so an interrupted
+run resumes where it stopped.
+
+Usage:
+    python backfill.py [--workers N] [--chunk-size 5000] [--batch-size 500]
+                       [--checkpoint backfill_checkpoint.json] [--force]
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+from settings import settings
+
+COLLECTION = "quiz_submissions"
+DEFAULT_CHECKPOINT = "backfill_checkpoint.json"
+
+# Fields needed to rebuild features; everything else stays on the server
+SOURCE_PROJECTION = {"quizId": 1, "responses": 1, "mlAnalytics": 1}
+
+_db = None
+
+
+def _init_worker():
+    """Per-process Mongo client (clients must not be shared across fork)"""
+    global _db
+    from pymongo import MongoClient
+
+    _db = MongoClient(settings.mongodb_uri)[settings.database_name]
+
+
+def plan_ranges(collection, chunk_size: int) -> List[Tuple[Any, Optional[Any]]]:
+    """
+    [lo, hi) _id ranges of ``chunk_size`` documents each (hi None = open end)
+
+    Only _id values are read, from the _id index, so planning is cheap
+    even for large collections.
+    """
+    bounds = []
+    for i, doc in enumerate(collection.find({}, {"_id": 1}).sort("_id", 1).batch_size(10000)):
+        if i % chunk_size == 0:
+            bounds.append(doc["_id"])
+    return [(lo, bounds[i + 1] if i + 1 < len(bounds) else None) for i, lo in enumerate(bounds)]
+
+
+def _load_quizzes(db, quiz_ids) -> Dict[str, Any]:
+    from bson import ObjectId
+    from quiz_cache import QUIZ_PROJECTION, CompiledQuiz
+
+    object_ids = [ObjectId(quiz_id) for quiz_id in quiz_ids if ObjectId.is_valid(quiz_id)]
+    if not object_ids:
+        return {}
+    return {
+        str(doc["_id"]): CompiledQuiz.from_document(doc)
+        for doc in db["quizzes"].find({"_id": {"$in": object_ids}}, QUIZ_PROJECTION)
+    }
+
+
+def rescore_batch(db, docs: List[Dict[str, Any]]) -> int:
+    """Recompute features and predictions for ``docs`` and write them back; returns documents written"""
+    import numpy as np
+    from pymongo import UpdateOne
+
+    from features import AnswerBatch, analytics_records
+    from ml_service import FEATURE_NAMES, predict_risk_batch
+
+    quizzes = _load_quizzes(db, {doc["quizId"] for doc in docs if doc.get("quizId") and doc.get("responses")})
+
+    # Submissions whose raw answers can be re-featurized go through the registry
+    batch = AnswerBatch()
+    rebuilt = []
+    for doc in docs:
+        quiz = quizzes.get(doc.get("quizId"))
+        if quiz is not None:
+            batch.add_responses(quiz, doc["responses"])
+            rebuilt.append(doc)
+    analytics = dict(zip((doc["_id"] for doc in rebuilt), analytics_records(batch))) if rebuilt else {}
+
+    scored = [doc for doc in docs if doc["_id"] in analytics or doc.get("mlAnalytics")]
+    if not scored:
+        return 0
+    X = np.array(
+        [
+            [float((analytics.get(doc["_id"]) or doc["mlAnalytics"]).get(name, 0.0)) for name in FEATURE_NAMES]
+            for doc in scored
+        ],
+        dtype=np.float64,
+    )
+    predictions = predict_risk_batch(X)
+
+    operations = []
+    for doc, prediction in zip(scored, predictions):
+        update = {"mlPrediction": prediction}
+        if doc["_id"] in analytics:
+            update["mlAnalytics"] = analytics[doc["_id"]]
+        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": update}))
+    db[COLLECTION].bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def rescore_range(lo, hi, batch_size: int, force: bool) -> Dict[str, Any]:
+    """Worker entry point: re-score every stale document with lo <= _id < hi"""
+    from ml_service import get_model_version
+
+    started = time.perf_counter()
+    query: Dict[str, Any] = {"_id": {"$gte": lo}}
+    if hi is not None:
+        query["_id"]["$lt"] = hi
+    if not force:
+        query["mlPrediction.modelVersion"] = {"$ne": get_model_version()}
+
+    written = 0
+    docs = []
+    for doc in _db[COLLECTION].find(query, SOURCE_PROJECTION).sort("_id", 1).batch_size(batch_size):
+        docs.append(doc)
+        if len(docs) >= batch_size:
+            written += rescore_batch(_db, docs)
+            docs = []
+    if docs:
+        written += rescore_batch(_db, docs)
+    return {"lo": str(lo), "written": written, "seconds": time.perf_counter() - started}
+
+
+def load_checkpoint(path: str, model_version: str) -> set:
+    """Range starts already finished for this model version"""
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("modelVersion") != model_version:
+        return set()
+    return set(data.get("done", []))
+
+
+def save_checkpoint(path: str, model_version: str, done: set):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"modelVersion": model_version, "done": sorted(done)}, f)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score stored submissions with the current risk model")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="documents per _id range")
+    parser.add_argument("--batch-size", type=int, default=500, help="documents per model call and bulk write")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="checkpoint file for resuming")
+    parser.add_argument("--force", action="store_true", help="also re-score documents already at this model version")
+    parser.add_argument("--no-rebuild", action="store_true", help="skip rebuilding global explanations afterwards")
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+
+    from ml_service import get_model, get_model_version
+
+    # Load the model before forking so workers share it copy-on-write
+    get_model()
+    model_version = get_model_version()
+
+    client = MongoClient(settings.mongodb_uri)
+    db = client[settings.database_name]
+    ranges = plan_ranges(db[COLLECTION], args.chunk_size)
+    done = set() if args.force else load_checkpoint(args.checkpoint, model_version)
+    pending = [(lo, hi) for lo, hi in ranges if str(lo) not in done]
+    print(f"Model {model_version}: {len(ranges)} ranges, {len(pending)} to process with {args.workers} workers")
+
+    started = time.perf_counter()
+    total = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(rescore_range, lo, hi, args.batch_size, args.force) for lo, hi in pending]
+        for completed, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            total += result["written"]
+            done.add(result["lo"])
+            save_checkpoint(args.checkpoint, model_version, done)
+            elapsed = time.perf_counter() - started
+            print(
+                f"[{completed}/{len(pending)}] range {result['lo']}: {result['written']} docs "
+                f"in {result['seconds']:.1f}s | total {total} docs, {total / elapsed:.0f} docs/s"
+            )
+
+    elapsed = time.perf_counter() - started
+    print(f"\nRe-scored {total} submissions in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} docs/s)")
+
+    if total:
+        import etags
+        import global_explanations
+
+        etags.bump_all(db)
+        if not args.no_rebuild:
+            buckets = global_explanations.rebuild(db)
+            print(f"Rebuilt {buckets} global explanation buckets")
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Batched what-if / counterfactual search for risk predictions
+
+Starting from a student's feature vector, every combination of up to
+``max_changes`` actionable features is moved step by step in its improving
+direction. All candidates are laid out as one NumPy matrix and scored with a
+single predict_proba call; the cheapest candidates that reach the target risk
+level are returned as the feature changes a teacher could aim for.
+
+Features are varied independently, so a candidate may raise a per-skill
+accuracy without changing overall_accuracy.
+"""
+from itertools import combinations, product
+from math import comb
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from ml_service import FEATURE_NAMES, RISK_LABELS, get_model
+
+# Features a student can work on: improving direction and reachable bound
+ACTIONABLE_FEATURES = {
+    "overall_accuracy": (1, 1.0),
+    "cognitive_accuracy": (1, 1.0),
+    "emotional_accuracy": (1, 1.0),
+    "behavioural_accuracy": (1, 1.0),
+    "emotional_regulation_score": (1, 1.0),
+    "negative_coping_responses": (-1, 0.0),
+    "attention_variance": (-1, 0.0),
+}
+
+# Typical spread of each feature; changes are costed in these units
+FEATURE_SCALES = {
+    "overall_accuracy": 1.0,
+    "cognitive_accuracy": 1.0,
+    "emotional_accuracy": 1.0,
+    "behavioural_accuracy": 1.0,
+    "avg_time_spent": 60.0,
+    "negative_coping_responses": 10.0,
+    "emotional_regulation_score": 1.0,
+    "attention_variance": 1.5,
+}
+
+# Whole-count features move in steps of at least one
+INTEGER_FEATURES = {"negative_coping_responses"}
+
+DEFAULT_STEPS = 10
+MAX_STEPS = 50
+MAX_CHANGES = 3
+# Upper bound on the candidate matrix; the grid is coarsened to fit
+MAX_CANDIDATES = 50000
+
+
+def _levels(name: str, current: float, steps: int) -> np.ndarray:
+    """Candidate values strictly between the current value and the bound, plus the bound"""
+    direction, bound = ACTIONABLE_FEATURES[name]
+    if (bound - current) * direction <= 0:
+        return np.empty(0)
+    if name in INTEGER_FEATURES:
+        count = min(steps, int(abs(bound - current)))
+        values = current + direction * np.ceil(np.arange(1, count + 1) * abs(bound - current) / count)
+        return np.unique(values)
+    return current + (bound - current) * np.arange(1, steps + 1) / steps
+
+
+def candidate_grid(base: Sequence[float], features: Sequence[str], max_changes: int, steps: int) -> np.ndarray:
+    """
+    Matrix of perturbed copies of ``base``: for every set of up to
+    ``max_changes`` features, the cartesian product of their levels
+    """
+    base = np.asarray(base, dtype=np.float64)
+    levels = {name: _levels(name, base[FEATURE_NAMES.index(name)], steps) for name in features}
+    movable = [name for name in features if len(levels[name])]
+
+    blocks = [base[None, :]]
+    for k in range(1, max_changes + 1):
+        for combo in combinations(movable, k):
+            columns = [FEATURE_NAMES.index(name) for name in combo]
+            values = np.array(list(product(*(levels[name] for name in combo))), dtype=np.float64)
+            block = np.repeat(base[None, :], len(values), axis=0)
+            block[:, columns] = values
+            blocks.append(block)
+    return np.concatenate(blocks)
+
+
+def _grid_size(n_features: int, max_changes: int, steps: int) -> int:
+    return sum(comb(n_features, k) * steps ** k for k in range(1, max_changes + 1))
+
+
+def _fit_steps(n_features: int, max_changes: int, steps: int) -> int:
+    """Largest step count <= ``steps`` whose grid fits MAX_CANDIDATES (at least 1)"""
+    lo, hi = 1, max(1, steps)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if _grid_size(n_features, max_changes, mid) <= MAX_CANDIDATES:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def find_counterfactuals(
+    feature_vector: Sequence[float],
+    target_risk: Optional[int] = None,
+    max_changes: int = 2,
+    steps: int = DEFAULT_STEPS,
+    limit: int = 5,
+    features: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Minimal feature changes that bring the predicted risk to ``target_risk`` or lower
+
+    ``target_risk`` defaults to one level below the current prediction.
+    Candidates are ranked by the number of changed features, then by the
+    total change in FEATURE_SCALES units; candidates that only add changes
+    on top of an already returned one are skipped.
+    """
+    features = [name for name in (features or ACTIONABLE_FEATURES) if name in ACTIONABLE_FEATURES]
+    max_changes = max(1, min(max_changes, MAX_CHANGES, len(features)))
+    steps = _fit_steps(len(features), max_changes, min(steps, MAX_STEPS))
+
+    base = np.asarray(feature_vector, dtype=np.float64)
+    X = candidate_grid(base, features, max_changes, steps)
+
+    # One batched model call for the whole grid
+    probabilities = np.asarray(get_model().predict_proba(X))
+    predicted = np.argmax(probabilities, axis=1)
+
+    current = int(predicted[0])
+    if target_risk is None:
+        target_risk = max(current - 1, 0)
+
+    scales = np.array([FEATURE_SCALES.get(name, 1.0) for name in FEATURE_NAMES])
+    deltas = X - base
+    changed = deltas != 0
+    n_changed = changed.sum(axis=1)
+    cost = (np.abs(deltas) / scales).sum(axis=1)
+
+    # Nothing to find when the student is already at or below the target
+    flips = np.flatnonzero((predicted <= target_risk) & (n_changed > 0) & (current > target_risk))
+    order = flips[np.lexsort((cost[flips], n_changed[flips]))]
+
+    selected: List[int] = []
+    for row in order:
+        # Skip supersets of a cheaper selected change (same moves plus extra ones)
+        dominated = any(
+            np.all(~changed[s] | (changed[row] & (np.abs(deltas[row]) >= np.abs(deltas[s]))))
+            for s in selected
+        )
+        if not dominated:
+            selected.append(int(row))
+            if len(selected) >= limit:
+                break
+
+    return {
+        "currentRisk": current,
+        "currentRiskLabel": RISK_LABELS[current],
+        "targetRisk": int(target_risk),
+        "targetRiskLabel": RISK_LABELS[int(target_risk)],
+        "candidatesEvaluated": int(len(X) - 1),
+        "counterfactuals": [
+            {
+                "changes": {
+                    FEATURE_NAMES[j]: {
+                        "from": float(base[j]),
+                        "to": round(float(X[row, j]), 4),
+                        "delta": round(float(deltas[row, j]), 4),
+                    }
+                    for j in np.flatnonzero(changed[row])
+                },
+                "predictedRisk": int(predicted[row]),
+                "riskLabel": RISK_LABELS[int(predicted[row])],
+                "probabilities": dict(zip(["low", "medium", "high"], probabilities[row].tolist())),
+                "cost": round(float(cost[row]), 4),
+            }
+            for row in selected
+        ],
+    }
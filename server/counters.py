@@ -0,0 +1,106 @@
+"""
+Write-behind buffer for user counters
+
+/quiz/submit records ``quizAttempts += 1`` here instead of issuing its own
+users.update_one. Increments are coalesced per user in memory and written
+by a lifespan task every COUNTER_FLUSH_SECONDS as one unordered bulk_write
+of $inc updates; the lifespan also flushes on shutdown so nothing buffered
+is lost on a graceful stop. A failed flush puts its deltas back for the
+next attempt.
+
+/auth/me goes through read(), which loads the user document and adds this
+worker's unflushed deltas without racing a flush in progress. Deltas held
+by other workers are not visible to it: with several workers (serve.py
+defaults to one per CPU) a count read right after a submit that another
+worker handled can lag by that submit until the next flush. This
+staleness is accepted and bounded by COUNTER_FLUSH_SECONDS (default 1s)
+plus the flush's own write time; a worker that is killed rather than
+stopped loses its unflushed deltas.
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from settings import settings
+
+COUNTER_FLUSH_SECONDS = settings.counter_flush_seconds
+
+USERS = "users"
+
+logger = logging.getLogger(__name__)
+
+
+def _user_filter(user_id: str) -> Dict[str, Any]:
+    from bson import ObjectId
+
+    return {"_id": ObjectId(user_id) if ObjectId.is_valid(user_id) else user_id}
+
+
+class CounterBuffer:
+    """Per-user $inc deltas awaiting a bulk write; one instance per app (``app.counters``)"""
+
+    def __init__(self, db):
+        self.db = db
+        self._pending: Dict[str, Dict[str, int]] = {}
+        # Guards _pending; held only for dict updates, never across I/O
+        self._lock = threading.Lock()
+        # Held for a whole flush so read() never sees deltas both written and pending
+        self._flush_lock = threading.Lock()
+
+    def increment(self, user_id: str, field: str, amount: int = 1):
+        with self._lock:
+            deltas = self._pending.setdefault(str(user_id), {})
+            deltas[field] = deltas.get(field, 0) + amount
+
+    def pending(self, user_id: str) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._pending.get(str(user_id), {}))
+
+    def read(self, user_id: str, load: Callable[[], Optional[dict]]) -> Tuple[Optional[dict], Dict[str, int]]:
+        """``load()``'s document together with the deltas not yet written to it"""
+        with self._flush_lock:
+            return load(), self.pending(user_id)
+
+    def flush(self) -> int:
+        """Write all buffered deltas in one bulk_write; returns the number of users updated"""
+        from pymongo import UpdateOne
+        from pymongo.errors import BulkWriteError
+
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            items = list(batch.items())
+            try:
+                self.db[USERS].bulk_write(
+                    [UpdateOne(_user_filter(user_id), {"$inc": deltas}) for user_id, deltas in items],
+                    ordered=False,
+                )
+            except BulkWriteError as e:
+                # Unordered: everything but the reported operations was applied
+                self._restore([items[error["index"]] for error in e.details.get("writeErrors", [])])
+                raise
+            except Exception:
+                self._restore(items)
+                raise
+            return len(items)
+
+    def _restore(self, items):
+        """Put unwritten deltas back for the next flush"""
+        with self._lock:
+            for user_id, deltas in items:
+                merged = self._pending.setdefault(user_id, {})
+                for field, amount in deltas.items():
+                    merged[field] = merged.get(field, 0) + amount
+
+
+async def run_flush_schedule(buffer: CounterBuffer, interval: float = COUNTER_FLUSH_SECONDS):
+    """Flush ``buffer`` every ``interval`` seconds (lifespan task)"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(buffer.flush)
+        except Exception:
+            logger.exception("Counter flush failed")
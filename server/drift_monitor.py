@@ -0,0 +1,277 @@
+"""
+Streaming feature-drift and prediction-drift monitor
+
+predict_student_risk feeds every scored feature vector into fixed-bin
+histograms (one per feature plus the predicted-class mix). On a schedule
+the histograms are compared with the training reference using PSI and a
+binned Kolmogorov-Smirnov statistic. Memory is fixed: no raw rows are kept
+and the database is never rescanned.
+
+The reference is the training distribution saved at DRIFT_REFERENCE_PATH;
+without one the report's status is "unavailable" rather than comparing live
+traffic with itself, and "reference_mismatch" when the reference was built
+for a different feature set. Histograms are per process, so under several
+workers each report covers only the traffic its worker scored; /ml/drift
+says so.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from ml_service import FEATURE_NAMES, RISK_LABELS
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+DRIFT_REFERENCE_PATH = settings.drift_reference_path
+DRIFT_INTERVAL_SECONDS = settings.drift_interval_seconds
+# Weight kept by older observations at each scheduled computation
+DRIFT_DECAY = settings.drift_decay
+DRIFT_BINS = 20
+
+# Histogram ranges per feature; values outside are clamped into the edge bins
+FEATURE_RANGES = {
+    "overall_accuracy": (0.0, 1.0),
+    "cognitive_accuracy": (0.0, 1.0),
+    "emotional_accuracy": (0.0, 1.0),
+    "behavioural_accuracy": (0.0, 1.0),
+    "avg_time_spent": (0.0, 120.0),
+    "negative_coping_responses": (0.0, 20.0),
+    "emotional_regulation_score": (0.0, 1.0),
+    "attention_variance": (0.0, 3.0),
+    "time_p50": (0.0, 120.0),
+    "time_p90": (0.0, 120.0),
+    "rushing_rate": (0.0, 1.0),
+    "longest_correct_streak": (0.0, 20.0),
+}
+
+# Avoid log(0) in PSI for empty bins
+_EPS = 1e-4
+
+
+class StreamingHistogram:
+    """Fixed-width histogram with decayable float counts and quantile estimates"""
+
+    def __init__(self, low: float, high: float, bins: int = DRIFT_BINS):
+        self.low = low
+        self.high = high
+        self.bins = bins
+        self.width = (high - low) / bins
+        self.counts = np.zeros(bins, dtype=np.float64)
+
+    def bin_index(self, values) -> np.ndarray:
+        idx = ((np.asarray(values, dtype=np.float64) - self.low) / self.width).astype(np.int64)
+        return np.clip(idx, 0, self.bins - 1)
+
+    def add(self, value: float):
+        self.counts[int(self.bin_index(value))] += 1.0
+
+    def add_many(self, values):
+        self.counts += np.bincount(self.bin_index(values), minlength=self.bins)
+
+    def decay(self, factor: float):
+        self.counts *= factor
+
+    @property
+    def total(self) -> float:
+        return float(self.counts.sum())
+
+    def proportions(self) -> np.ndarray:
+        total = self.total
+        if total == 0:
+            return np.zeros(self.bins)
+        return self.counts / total
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Approximate quantile by linear interpolation inside the containing bin"""
+        total = self.total
+        if total == 0:
+            return None
+        cdf = np.cumsum(self.counts) / total
+        i = int(np.searchsorted(cdf, q, side="left"))
+        i = min(i, self.bins - 1)
+        prev = cdf[i - 1] if i > 0 else 0.0
+        within = (q - prev) / (cdf[i] - prev) if cdf[i] > prev else 0.0
+        return float(self.low + (i + within) * self.width)
+
+
+def population_stability_index(expected: np.ndarray, actual: np.ndarray) -> float:
+    """PSI between two binned distributions (proportions)"""
+    e = np.clip(expected, _EPS, None)
+    a = np.clip(actual, _EPS, None)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def binned_ks(expected: np.ndarray, actual: np.ndarray) -> float:
+    """Kolmogorov-Smirnov statistic evaluated at the bin edges"""
+    return float(np.max(np.abs(np.cumsum(expected) - np.cumsum(actual))))
+
+
+class DriftReference:
+    """Training-time bin proportions per feature and class mix"""
+
+    def __init__(self, feature_proportions: Dict[str, List[float]], class_proportions: List[float], rows: int):
+        self.feature_proportions = {k: np.asarray(v, dtype=np.float64) for k, v in feature_proportions.items()}
+        self.class_proportions = np.asarray(class_proportions, dtype=np.float64)
+        self.rows = rows
+
+    @classmethod
+    def from_matrix(cls, X: np.ndarray, predicted: Sequence[int]) -> "DriftReference":
+        """Build a reference from a training feature matrix and the model's predictions on it"""
+        X = np.asarray(X)
+        feature_proportions = {}
+        for j, name in enumerate(FEATURE_NAMES):
+            hist = StreamingHistogram(*FEATURE_RANGES[name])
+            hist.add_many(X[:, j])
+            feature_proportions[name] = hist.proportions().tolist()
+        class_counts = np.bincount(np.asarray(predicted, dtype=np.int64), minlength=len(RISK_LABELS))
+        class_proportions = (class_counts / max(class_counts.sum(), 1)).tolist()
+        return cls(feature_proportions, class_proportions, rows=len(X))
+
+    @classmethod
+    def load(cls, path: str) -> "DriftReference":
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["features"], data["classes"], data.get("rows", 0))
+
+    def mismatch(self) -> Optional[str]:
+        """Why this reference cannot be compared with the live FEATURE_NAMES, or None"""
+        if set(self.feature_proportions) != set(FEATURE_NAMES):
+            missing = sorted(set(FEATURE_NAMES) - set(self.feature_proportions))
+            extra = sorted(set(self.feature_proportions) - set(FEATURE_NAMES))
+            return f"Reference built for another feature set (missing {missing}, unexpected {extra})"
+        wrong_bins = [name for name in FEATURE_NAMES if len(self.feature_proportions[name]) != DRIFT_BINS]
+        if wrong_bins:
+            return f"Reference bins for {wrong_bins} do not have {DRIFT_BINS} entries"
+        if len(self.class_proportions) != len(RISK_LABELS):
+            return f"Reference class mix does not have {len(RISK_LABELS)} entries"
+        return None
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "features": {k: v.tolist() for k, v in self.feature_proportions.items()},
+                    "classes": self.class_proportions.tolist(),
+                    "rows": self.rows,
+                },
+                f,
+            )
+
+
+class DriftMonitor:
+    """
+    In-process drift monitor
+
+    observe() is called on the request path and only bumps histogram bins;
+    compute() does the comparison and is run on a schedule.
+    """
+
+    def __init__(self, reference: Optional[DriftReference] = None, decay: float = DRIFT_DECAY):
+        self.reference: Optional[DriftReference] = None
+        self.reference_error: Optional[str] = None
+        self.set_reference(reference)
+        self.decay = decay
+        self.histograms = {name: StreamingHistogram(*FEATURE_RANGES[name]) for name in FEATURE_NAMES}
+        self.class_counts = np.zeros(len(RISK_LABELS), dtype=np.float64)
+        self.observed = 0
+        self.last_report: Dict[str, Any] = {"status": "pending"}
+        self._lock = threading.Lock()
+
+    def set_reference(self, reference: Optional[DriftReference]):
+        """Use ``reference`` unless it does not match the live feature set"""
+        self.reference_error = reference.mismatch() if reference is not None else None
+        if self.reference_error:
+            logger.warning("Drift reference rejected: %s", self.reference_error)
+        self.reference = None if self.reference_error else reference
+
+    def observe(self, feature_vector: Sequence[float], predicted_risk: int):
+        with self._lock:
+            for name, value in zip(FEATURE_NAMES, feature_vector):
+                self.histograms[name].add(value)
+            self.class_counts[predicted_risk] += 1.0
+            self.observed += 1
+
+    def compute(self) -> Dict[str, Any]:
+        """Compare the current window with the reference, then decay the window"""
+        with self._lock:
+            window = float(self.class_counts.sum())
+            features = {}
+            for name, hist in self.histograms.items():
+                stats = {
+                    "p10": hist.quantile(0.10),
+                    "p50": hist.quantile(0.50),
+                    "p90": hist.quantile(0.90),
+                }
+                if self.reference is not None and window > 0:
+                    expected = self.reference.feature_proportions[name]
+                    actual = hist.proportions()
+                    stats["psi"] = population_stability_index(expected, actual)
+                    stats["ks"] = binned_ks(expected, actual)
+                features[name] = stats
+
+            class_mix = (self.class_counts / window).tolist() if window > 0 else [0.0] * len(RISK_LABELS)
+            prediction = {"mix": dict(zip(RISK_LABELS, class_mix))}
+            if self.reference is not None and window > 0:
+                prediction["psi"] = population_stability_index(self.reference.class_proportions, np.asarray(class_mix))
+
+            for hist in self.histograms.values():
+                hist.decay(self.decay)
+            self.class_counts *= self.decay
+
+        if self.reference is not None:
+            status = "ok"
+        elif self.reference_error:
+            status = "reference_mismatch"
+        else:
+            status = "unavailable"
+        self.last_report = {
+            "status": status,
+            "computedAt": time.time(),
+            "observed": self.observed,
+            "windowWeight": window,
+            "referenceRows": self.reference.rows if self.reference is not None else 0,
+            "features": features,
+            "prediction": prediction,
+        }
+        if self.reference is None:
+            self.last_report["reason"] = self.reference_error or "No training reference (set DRIFT_REFERENCE_PATH)"
+        return self.last_report
+
+
+def load_reference() -> Optional[DriftReference]:
+    """
+    Training reference saved at DRIFT_REFERENCE_PATH (DriftReference.save), or None if unset
+
+    There is deliberately no fallback to production data: a reference built
+    from live traffic hides the drift it is meant to detect.
+    """
+    if not DRIFT_REFERENCE_PATH:
+        return None
+    return DriftReference.load(DRIFT_REFERENCE_PATH)
+
+
+async def run_drift_schedule(monitor: DriftMonitor, interval: float = DRIFT_INTERVAL_SECONDS):
+    """Recompute drift statistics every ``interval`` seconds (lifespan task)"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            monitor.compute()
+        except Exception:
+            logger.exception("Drift computation failed")
+
+
+_monitor: Optional[DriftMonitor] = None
+
+
+def get_drift_monitor() -> DriftMonitor:
+    """Process-wide drift monitor"""
+    global _monitor
+    if _monitor is None:
+        _monitor = DriftMonitor()
+    return _monitor
@@ -0,0 +1,95 @@
+"""
+ETag validators for the submission listings
+
+A listing's ETag combines a change counter (bumped by every route that
+writes submissions) with the newest submittedAt/completedAt of the listed
+documents. Both are read with indexed, projected lookups, so a poll whose
+If-None-Match still matches gets a 304 without the document bodies ever
+being queried or serialised.
+
+Scopes:
+    submissions     every submission (teacher listing)
+    user:<id>       one student's submissions (history)
+"""
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from fastapi import Response
+
+COLLECTION = "change_counters"
+SUBMISSIONS = "quiz_submissions"
+
+ALL_SUBMISSIONS_SCOPE = "submissions"
+
+# Clients must revalidate on every use; the response is per user
+CACHE_CONTROL = "private, no-cache"
+
+
+def user_scope(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def ensure_indexes(db):
+    """Indexes serving the newest-timestamp lookups (and the listings themselves)"""
+    db[SUBMISSIONS].create_index([("submittedAt", -1)])
+    db[SUBMISSIONS].create_index([("userId", 1), ("submittedAt", -1)])
+
+
+def bump(db, *scopes: str):
+    """Invalidate the ETags of ``scopes`` in one round trip"""
+    from pymongo import UpdateOne
+
+    scopes = [scope for scope in dict.fromkeys(scopes) if scope]
+    if not scopes:
+        return
+    db[COLLECTION].bulk_write(
+        [UpdateOne({"_id": scope}, {"$inc": {"version": 1}}, upsert=True) for scope in scopes],
+        ordered=False,
+    )
+
+
+def bump_all(db):
+    """Invalidate every listing ETag (after a bulk rewrite such as a re-score)"""
+    db[COLLECTION].update_many({}, {"$inc": {"version": 1}})
+    bump(db, ALL_SUBMISSIONS_SCOPE)
+
+
+def _millis(timestamp: Optional[datetime]) -> int:
+    if timestamp is None:
+        return 0
+    return int(timestamp.timestamp() * 1000)
+
+
+def listing_etag(db, scope: str, query: Dict[str, Any]) -> str:
+    """ETag for the submissions matching ``query``, tracked under ``scope``"""
+    counter = db[COLLECTION].find_one({"_id": scope}, {"version": 1})
+    version = counter.get("version", 0) if counter else 0
+
+    newest = db[SUBMISSIONS].find_one(
+        query,
+        {"_id": 0, "submittedAt": 1, "completedAt": 1},
+        sort=[("submittedAt", -1)],
+    )
+    newest_ms = 0
+    if newest:
+        newest_ms = max(_millis(newest.get("submittedAt")), _millis(newest.get("completedAt")))
+    return f'"{version:x}-{newest_ms:x}"'
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against ``etag``"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def validator_headers(etag: str) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
@@ -0,0 +1,266 @@
+"""
+Columnar, memory-mapped feature store
+
+Every quiz submission's model feature vector is appended to a small set of
+fixed-width column files alongside the Mongo document (which stays the
+source of truth). Each feature set gets its own directory,
+FEATURE_STORE_DIR/<feature set>, since the row layout depends on it:
+
+    features.f32    float32, one row of len(FEATURE_NAMES) values per submission
+    timestamps.f64  float64 UNIX seconds (submittedAt), in append order, which
+                    is only roughly time order (concurrent requests/workers)
+    user_ids.bin    fixed-width ASCII user ids, zero padded
+
+Readers memory-map the files, so analytic jobs (training, drift checks,
+explainer background sampling) get zero-copy NumPy views without decoding BSON.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from features import FEATURE_SET_VERSION
+from ml_service import FEATURE_NAMES
+from settings import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+FEATURE_STORE_DIR = settings.feature_store_dir
+
+USER_ID_WIDTH = 36  # fits both ObjectId hex (24) and uuid4 (36) strings
+
+_FEATURES_FILE = "features.f32"
+_TIMESTAMPS_FILE = "timestamps.f64"
+_USER_IDS_FILE = "user_ids.bin"
+_META_FILE = "meta.json"
+
+
+def _to_epoch(timestamp: datetime) -> float:
+    """Convert a (naive UTC or aware) datetime to UNIX seconds"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+class FeatureFrame:
+    """Zero-copy column views over a range of feature store rows"""
+
+    def __init__(self, features: np.ndarray, timestamps: np.ndarray, user_ids: np.ndarray, feature_names: List[str]):
+        self.features = features
+        self.timestamps = timestamps
+        self.user_ids = user_ids
+        self.feature_names = feature_names
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def column(self, name: str) -> np.ndarray:
+        """View of a single feature column"""
+        return self.features[:, self.feature_names.index(name)]
+
+    def user_id_strings(self) -> List[str]:
+        """Decode the fixed-width user ids (copies)"""
+        return [uid.decode("ascii") for uid in self.user_ids]
+
+
+class FeatureStore:
+    """
+    Append-only columnar store of model feature vectors
+
+    Writes are serialised with a thread lock and, where available, an
+    exclusive file lock so several worker processes can share a directory.
+    """
+
+    def __init__(self, directory: str, feature_names: Sequence[str] = FEATURE_NAMES):
+        self.directory = directory
+        self.feature_names = list(feature_names)
+        self.n_features = len(self.feature_names)
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._check_meta()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _check_meta(self):
+        meta_path = self._path(_META_FILE)
+        meta = {"feature_names": self.feature_names, "user_id_width": USER_ID_WIDTH}
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                existing = json.load(f)
+            if existing != meta:
+                raise ValueError(
+                    f"Feature store at {self.directory} was written with a different layout: {existing}"
+                )
+        else:
+            with open(meta_path, "w") as f:
+                json.dump(meta, f)
+
+    def append(self, features: Sequence[float], timestamp: datetime, user_id: str):
+        """Append one submission's feature vector"""
+        self.append_many([features], [timestamp], [user_id])
+
+    def append_many(self, features: Sequence[Sequence[float]], timestamps: Sequence[datetime], user_ids: Sequence[str]):
+        """Append several rows in one write per column file"""
+        matrix = np.asarray(features, dtype=np.float32).reshape(-1, self.n_features)
+        epochs = np.array([_to_epoch(ts) for ts in timestamps], dtype=np.float64)
+        ids = np.array([str(uid).encode("ascii")[:USER_ID_WIDTH] for uid in user_ids], dtype=f"S{USER_ID_WIDTH}")
+        if not (len(matrix) == len(epochs) == len(ids)):
+            raise ValueError("features, timestamps and user_ids must have the same length")
+
+        with self._lock, open(self._path(_META_FILE), "rb") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._truncate_to_committed()
+                # Write the timestamp column last: row counts are derived from it,
+                # so readers never see a row whose features are not yet on disk.
+                for name, column in ((_FEATURES_FILE, matrix), (_USER_IDS_FILE, ids), (_TIMESTAMPS_FILE, epochs)):
+                    with open(self._path(name), "ab") as f:
+                        f.write(column.tobytes())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _truncate_to_committed(self):
+        """Drop trailing bytes of a write interrupted before or while its timestamps landed"""
+        rows = len(self)
+        # Includes the timestamp column itself, which may end in a partial row
+        for name, row_size in (
+            (_FEATURES_FILE, 4 * self.n_features),
+            (_USER_IDS_FILE, USER_ID_WIDTH),
+            (_TIMESTAMPS_FILE, 8),
+        ):
+            path = self._path(name)
+            if os.path.exists(path) and os.path.getsize(path) > rows * row_size:
+                os.truncate(path, rows * row_size)
+
+    def __len__(self) -> int:
+        path = self._path(_TIMESTAMPS_FILE)
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // 8
+
+    def _memmap(self, name: str, dtype, rows: int, shape_tail=()) -> np.ndarray:
+        if rows == 0:
+            return np.empty((0,) + shape_tail, dtype=dtype)
+        return np.memmap(self._path(name), dtype=dtype, mode="r", shape=(rows,) + shape_tail)
+
+    def read(self) -> FeatureFrame:
+        """Memory-map all committed rows"""
+        rows = len(self)
+        return FeatureFrame(
+            features=self._memmap(_FEATURES_FILE, np.float32, rows, (self.n_features,)),
+            timestamps=self._memmap(_TIMESTAMPS_FILE, np.float64, rows),
+            user_ids=self._memmap(_USER_IDS_FILE, f"S{USER_ID_WIDTH}", rows),
+            feature_names=self.feature_names,
+        )
+
+    def read_range(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> FeatureFrame:
+        """
+        Rows with start <= timestamp < end
+
+        Rows are not strictly time ordered (submittedAt is taken before the
+        row is appended), so the range is selected with a mask. When the
+        matching rows are contiguous, as they mostly are, the result is
+        zero-copy slices; otherwise the columns are gathered (copied).
+        """
+        frame = self.read()
+        mask = np.ones(len(frame), dtype=bool)
+        if start is not None:
+            mask &= frame.timestamps >= _to_epoch(start)
+        if end is not None:
+            mask &= frame.timestamps < _to_epoch(end)
+        rows = np.flatnonzero(mask)
+        if len(rows) == 0 or rows[-1] - rows[0] + 1 == len(rows):
+            selection = slice(int(rows[0]), int(rows[-1]) + 1) if len(rows) else slice(0, 0)
+        else:
+            selection = rows
+        return FeatureFrame(
+            features=frame.features[selection],
+            timestamps=frame.timestamps[selection],
+            user_ids=frame.user_ids[selection],
+            feature_names=self.feature_names,
+        )
+
+
+def feature_vector_from_analytics(ml_analytics: Dict[str, Any], feature_names: Sequence[str] = FEATURE_NAMES) -> List[float]:
+    """Model feature vector from a submission's mlAnalytics dict"""
+    return [float(ml_analytics.get(name, 0.0)) for name in feature_names]
+
+
+def _swap_in(new_directory: str, directory: str):
+    """Replace ``directory`` with ``new_directory`` (two renames, then drop the old copy)"""
+    old_directory = f"{directory}.old-{os.getpid()}-{int(time.time())}"
+    if os.path.exists(directory):
+        os.rename(directory, old_directory)
+    os.rename(new_directory, directory)
+    shutil.rmtree(old_directory, ignore_errors=True)
+
+
+def export_from_collection(
+    collection,
+    directory: Optional[str] = None,
+    feature_names: Sequence[str] = FEATURE_NAMES,
+    batch_size: int = 5000,
+) -> int:
+    """
+    Rebuild a feature store from the quiz_submissions collection
+
+    Streams documents in submittedAt order with a projection into a fresh
+    directory next to ``directory`` (default: the deployed feature set's
+    store), then swaps it in, so an existing store is replaced rather than
+    appended to. Rows appended by live workers during the rebuild stay only
+    in Mongo; run it while submissions are quiet. Returns the number of
+    rows written.
+    """
+    directory = directory or feature_store_path()
+    new_directory = f"{directory}.rebuild-{os.getpid()}-{int(time.time())}"
+    shutil.rmtree(new_directory, ignore_errors=True)
+    store = FeatureStore(new_directory, feature_names)
+
+    cursor = collection.find(
+        {"mlAnalytics": {"$exists": True}},
+        {"mlAnalytics": 1, "submittedAt": 1, "userId": 1},
+    ).sort("submittedAt", 1).batch_size(batch_size)
+
+    written = 0
+    features, timestamps, user_ids = [], [], []
+    for doc in cursor:
+        features.append(feature_vector_from_analytics(doc["mlAnalytics"], feature_names))
+        timestamps.append(doc["submittedAt"])
+        user_ids.append(doc.get("userId", ""))
+        if len(features) >= batch_size:
+            store.append_many(features, timestamps, user_ids)
+            written += len(features)
+            features, timestamps, user_ids = [], [], []
+    if features:
+        store.append_many(features, timestamps, user_ids)
+        written += len(features)
+
+    _swap_in(new_directory, directory)
+    return written
+
+
+_store: Optional[FeatureStore] = None
+
+
+def feature_store_path(feature_set: str = FEATURE_SET_VERSION) -> str:
+    return os.path.join(FEATURE_STORE_DIR, feature_set)
+
+
+def get_feature_store() -> FeatureStore:
+    """Process-wide feature store for the deployed feature set"""
+    global _store
+    if _store is None:
+        _store = FeatureStore(feature_store_path())
+    return _store
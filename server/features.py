@@ -0,0 +1,357 @@
+"""
+Feature-engineering registry
+
+Every feature is declared once, next to its vectorized implementation over
+flat per-answer arrays. One AnswerBatch holds any number of submissions in
+CSR layout (answers of all submissions concatenated, plus a submission
+index per answer), so a single submission and a backfill of thousands go
+through the same NumPy code with no per-feature Python loop per answer.
+
+The model's column order is a named, versioned feature set:
+
+    FEATURE_SETS["v1"]   the 8 columns the current risk model was trained on
+    FEATURE_SETS["v2"]   v1 plus time percentiles, rushing rate and streaks
+
+FEATURE_SET_VERSION (FEATURE_SET) picks the set for the deployed model.
+Adding a feature means registering it here and listing it in a new set.
+
+The v1 features reproduce the original inline computation value for
+value: sums run in answer order and results are rounded per value with
+Python's round(). They are computed over the graded answers only; answers
+to question ids that are not in the quiz are ignored (the inline code
+counted their time), which also makes them reproducible from the stored
+``responses``.
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from settings import settings
+
+FEATURE_SET_VERSION = settings.feature_set
+
+SKILLS = ["Cognitive", "Emotional", "Behavioural"]
+_SKILL_CODES = {"Cognitive": 0, "Emotional": 1, "Behavioural": 2, "Behavioral": 2}
+
+NEGATIVE_COPING_KEYWORDS = [
+    "yell", "scream", "shout", "angry", "furious", "rage", "tantrum",
+    "give up", "quit", "ignore", "avoid", "worry", "panic", "afraid",
+    "anxious", "nervous", "scared", "cry", "upset", "frustrated"
+]
+
+# Answers faster than this count as rushed
+RUSH_SECONDS = 3
+
+
+class AnswerBatch:
+    """
+    Per-answer arrays for one or more graded submissions
+
+    Rows are appended with add() and converted to NumPy arrays once, on
+    first use; per-submission aggregates are cached on the batch so
+    features sharing them (e.g. the skill accuracies) compute them once.
+    """
+
+    def __init__(self):
+        self._submission: List[int] = []
+        self._correct: List[bool] = []
+        self._time: List[float] = []
+        self._skill: List[int] = []
+        self._coping: List[bool] = []
+        self._negative: List[bool] = []
+        self._n_questions: List[int] = []
+        self._frozen = False
+        self.cache: Dict[str, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._n_questions)
+
+    def add(
+        self,
+        quiz,
+        question_index: Sequence[int],
+        correct: Sequence[bool],
+        time_spent: Sequence[float],
+        answer_text: Sequence[str],
+    ):
+        """Append one submission graded against a quiz_cache.CompiledQuiz"""
+        if self._frozen:
+            raise ValueError("AnswerBatch is read-only once features have been computed")
+        row = len(self._n_questions)
+        self._n_questions.append(len(quiz))
+        for i, is_correct, seconds, text in zip(question_index, correct, time_spent, answer_text):
+            coping = quiz.coping[i]
+            self._submission.append(row)
+            self._correct.append(bool(is_correct))
+            self._time.append(seconds)
+            self._skill.append(_SKILL_CODES.get(quiz.skill_types[i], -1))
+            self._coping.append(coping)
+            lowered = text.lower() if coping else ""
+            self._negative.append(coping and any(keyword in lowered for keyword in NEGATIVE_COPING_KEYWORDS))
+
+    def add_graded(self, quiz, graded):
+        """Append a quiz_cache.GradedAnswers"""
+        self.add(quiz, graded.question_index, graded.correct, graded.time_spent, graded.answer_text)
+
+    def add_responses(self, quiz, responses: Dict[str, List[int]]):
+        """Append a stored submission's compact ``responses`` arrays"""
+        free_text = responses.get("x", {})
+        texts = [
+            quiz.options[q][a] if a >= 0 else free_text.get(str(position), "")
+            for position, (q, a) in enumerate(zip(responses["q"], responses["a"]))
+        ]
+        self.add(quiz, responses["q"], responses["c"], responses["t"], texts)
+
+    def freeze(self):
+        if self._frozen:
+            return
+        self.submission = np.asarray(self._submission, dtype=np.int64)
+        self.correct = np.asarray(self._correct, dtype=bool)
+        self.time_spent = np.asarray(self._time, dtype=np.float64)
+        self.skill = np.asarray(self._skill, dtype=np.int64)
+        self.coping = np.asarray(self._coping, dtype=bool)
+        self.negative = np.asarray(self._negative, dtype=bool)
+        self.n_questions = np.asarray(self._n_questions, dtype=np.float64)
+        self._frozen = True
+
+    def per_submission(self, values) -> np.ndarray:
+        """Sum of per-answer ``values`` for each submission"""
+        return np.bincount(self.submission, weights=np.asarray(values, dtype=np.float64), minlength=len(self))
+
+    def memo(self, key: str, compute: Callable[[], Any]) -> Any:
+        if key not in self.cache:
+            self.cache[key] = compute()
+        return self.cache[key]
+
+
+class Feature:
+    def __init__(self, name: str, compute: Callable[[AnswerBatch], np.ndarray], integer: bool, description: str):
+        self.name = name
+        self.compute = compute
+        self.integer = integer
+        self.description = description
+
+
+FEATURES: Dict[str, Feature] = {}
+
+
+def register(name: str, integer: bool = False):
+    """Decorator registering a vectorized feature: fn(batch) -> array of len(batch)"""
+    def decorator(fn: Callable[[AnswerBatch], np.ndarray]):
+        if name in FEATURES:
+            raise ValueError(f"Feature {name} is already registered")
+        FEATURES[name] = Feature(name, fn, integer, (fn.__doc__ or "").strip())
+        return fn
+    return decorator
+
+
+def _round(values: np.ndarray, decimals: int) -> np.ndarray:
+    """Python's round() per value; np.round scales by 10**decimals first and can differ"""
+    return np.array([round(v, decimals) for v in values.tolist()], dtype=np.float64)
+
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray, decimals: int) -> np.ndarray:
+    """Rounded numerator/denominator, 0 where the denominator is 0"""
+    out = np.zeros(len(numerator), dtype=np.float64)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return _round(out, decimals)
+
+
+def _skill_counts(batch: AnswerBatch) -> Dict[str, np.ndarray]:
+    """(submissions, 3) correct and total answers per skill"""
+    def compute():
+        known = batch.skill >= 0
+        slots = batch.submission[known] * len(SKILLS) + batch.skill[known]
+        size = len(batch) * len(SKILLS)
+        return {
+            "total": np.bincount(slots, minlength=size).reshape(-1, len(SKILLS)).astype(np.float64),
+            "correct": np.bincount(slots, weights=batch.correct[known], minlength=size).reshape(-1, len(SKILLS)),
+        }
+    return batch.memo("skill_counts", compute)
+
+
+def _answered(batch: AnswerBatch) -> np.ndarray:
+    return batch.memo("answered", lambda: np.bincount(batch.submission, minlength=len(batch)).astype(np.float64))
+
+
+def _sorted_times(batch: AnswerBatch):
+    """Times sorted within each submission, with each submission's start offset"""
+    def compute():
+        order = np.lexsort((batch.time_spent, batch.submission))
+        starts = np.concatenate(([0], np.cumsum(_answered(batch))[:-1])).astype(np.int64)
+        return batch.time_spent[order], starts
+    return batch.memo("sorted_times", compute)
+
+
+def _time_percentile(batch: AnswerBatch, q: float) -> np.ndarray:
+    """Nearest-rank percentile of time spent per submission"""
+    times, starts = _sorted_times(batch)
+    counts = _answered(batch).astype(np.int64)
+    out = np.zeros(len(batch), dtype=np.float64)
+    has = counts > 0
+    rank = np.ceil(q * counts[has]).astype(np.int64) - 1
+    out[has] = times[starts[has] + np.clip(rank, 0, None)]
+    return out
+
+
+@register("overall_accuracy")
+def overall_accuracy(batch):
+    """Correct answers / questions in the quiz"""
+    return _ratio(batch.per_submission(batch.correct), batch.n_questions, 3)
+
+
+def _skill_accuracy(skill: str):
+    j = SKILLS.index(skill)
+
+    def compute(batch):
+        counts = _skill_counts(batch)
+        return _ratio(counts["correct"][:, j], counts["total"][:, j], 2)
+
+    compute.__doc__ = f"Accuracy on {skill} questions"
+    return compute
+
+
+register("cognitive_accuracy")(_skill_accuracy("Cognitive"))
+register("emotional_accuracy")(_skill_accuracy("Emotional"))
+register("behavioural_accuracy")(_skill_accuracy("Behavioural"))
+
+
+@register("avg_time_spent")
+def avg_time_spent(batch):
+    """Seconds spent per question"""
+    return _ratio(batch.per_submission(batch.time_spent), batch.n_questions, 1)
+
+
+@register("negative_coping_responses", integer=True)
+def negative_coping_responses(batch):
+    """Emotional/behavioural answers that are wrong or mention a negative coping keyword"""
+    return batch.per_submission(batch.coping & (batch.negative | ~batch.correct))
+
+
+@register("positive_coping_responses", integer=True)
+def positive_coping_responses(batch):
+    """Correct emotional/behavioural answers without negative coping keywords"""
+    return batch.per_submission(batch.coping & ~batch.negative & batch.correct)
+
+
+@register("emotional_regulation_score")
+def emotional_regulation_score(batch):
+    """Positive coping responses / emotional and behavioural questions answered"""
+    counts = _skill_counts(batch)["total"]
+    return _ratio(positive_coping_responses(batch), counts[:, 1] + counts[:, 2], 2)
+
+
+@register("attention_variance")
+def attention_variance(batch):
+    """Coefficient of variation of time spent (0 for fewer than two answers)"""
+    answered = _answered(batch)
+    mean = np.zeros(len(batch))
+    np.divide(batch.per_submission(batch.time_spent), answered, out=mean, where=answered > 0)
+    deviation = batch.time_spent - mean[batch.submission]
+    variance = np.zeros(len(batch))
+    np.divide(batch.per_submission(deviation ** 2), answered, out=variance, where=answered > 0)
+    # ** 0.5 (pow) rather than sqrt, as in the original computation
+    out = _ratio(np.power(variance, 0.5), mean, 2)
+    out[answered <= 1] = 0.0
+    return out
+
+
+@register("total_questions", integer=True)
+def total_questions(batch):
+    """Questions in the quiz"""
+    return batch.n_questions
+
+
+@register("total_time_spent", integer=True)
+def total_time_spent(batch):
+    """Seconds spent on the quiz"""
+    return batch.per_submission(batch.time_spent)
+
+
+@register("time_p50")
+def time_p50(batch):
+    """Median seconds per answer"""
+    return _time_percentile(batch, 0.5)
+
+
+@register("time_p90")
+def time_p90(batch):
+    """90th percentile seconds per answer"""
+    return _time_percentile(batch, 0.9)
+
+
+@register("rushing_rate")
+def rushing_rate(batch):
+    """Share of answers given in under RUSH_SECONDS"""
+    return _ratio(batch.per_submission(batch.time_spent < RUSH_SECONDS), _answered(batch), 2)
+
+
+@register("longest_correct_streak", integer=True)
+def longest_correct_streak(batch):
+    """Longest run of consecutive correct answers"""
+    idx = np.arange(len(batch.correct))
+    is_start = np.ones(len(idx), dtype=bool)
+    is_start[1:] = batch.submission[1:] != batch.submission[:-1]
+    # Position of the last streak breaker at or before each answer
+    breakers = np.where(~batch.correct, idx, np.where(is_start, idx - 1, -1))
+    last_break = np.maximum.accumulate(breakers) if len(idx) else breakers
+    run = np.where(batch.correct, idx - last_break, 0)
+    out = np.zeros(len(batch), dtype=np.float64)
+    np.maximum.at(out, batch.submission, run)
+    return out
+
+
+FEATURE_SETS: Dict[str, List[str]] = {
+    "v1": [
+        "overall_accuracy",
+        "cognitive_accuracy",
+        "emotional_accuracy",
+        "behavioural_accuracy",
+        "avg_time_spent",
+        "negative_coping_responses",
+        "emotional_regulation_score",
+        "attention_variance",
+    ],
+}
+FEATURE_SETS["v2"] = FEATURE_SETS["v1"] + ["time_p50", "time_p90", "rushing_rate", "longest_correct_streak"]
+
+# Stored in each submission's mlAnalytics, in this order
+ANALYTICS_FEATURES = [
+    "overall_accuracy",
+    "cognitive_accuracy",
+    "emotional_accuracy",
+    "behavioural_accuracy",
+    "avg_time_spent",
+    "negative_coping_responses",
+    "positive_coping_responses",
+    "emotional_regulation_score",
+    "attention_variance",
+    "total_questions",
+    "total_time_spent",
+] + [name for name in FEATURE_SETS["v2"] if name not in FEATURE_SETS["v1"]]
+
+
+def model_feature_names(version: str = FEATURE_SET_VERSION) -> List[str]:
+    if version not in FEATURE_SETS:
+        raise ValueError(f"Unknown feature set {version}; known: {sorted(FEATURE_SETS)}")
+    return list(FEATURE_SETS[version])
+
+
+def feature_matrix(batch: AnswerBatch, names: Optional[Sequence[str]] = None) -> np.ndarray:
+    """C-contiguous float64 matrix, one row per submission, one column per feature in ``names``"""
+    names = model_feature_names() if names is None else names
+    batch.freeze()
+    X = np.empty((len(batch), len(names)), dtype=np.float64)
+    for j, name in enumerate(names):
+        X[:, j] = FEATURES[name].compute(batch)
+    return X
+
+
+def analytics_records(batch: AnswerBatch, names: Sequence[str] = ANALYTICS_FEATURES) -> List[Dict[str, Any]]:
+    """mlAnalytics dicts (plain Python numbers) for every submission in ``batch``"""
+    X = feature_matrix(batch, names)
+    integer = [FEATURES[name].integer for name in names]
+    return [
+        {name: int(value) if is_int else float(value) for name, value, is_int in zip(names, row, integer)}
+        for row in X.tolist()
+    ]
@@ -0,0 +1,163 @@
+"""
+Cohort-level global explanations
+
+Every risk prediction adds its SHAP values to a small running-sum document
+per department and time bucket in ``global_explanations``:
+
+    {
+        "_id": "<department>:<bucket start, ISO>",
+        "department": str,
+        "bucket": datetime,
+        "count": int,
+        "absShap": {feature: sum of |SHAP|},
+        "shap": {feature: sum of signed SHAP},
+        "risk": {risk label: count},
+    }
+
+Updates are a single upserted $inc, so they are atomic and commutative
+across workers. Reads combine a handful of bucket documents into mean
+|SHAP| and mean signed SHAP per feature, without touching submissions.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from settings import settings
+
+COLLECTION = "global_explanations"
+EXPLANATION_BUCKET_SECONDS = settings.explanation_bucket_seconds
+
+UNKNOWN_DEPARTMENT = "unassigned"
+
+
+def ensure_indexes(db):
+    db[COLLECTION].create_index([("department", 1), ("bucket", -1)])
+
+
+def bucket_start(timestamp: datetime, bucket_seconds: int = EXPLANATION_BUCKET_SECONDS) -> datetime:
+    """Start of the (naive UTC) time bucket containing ``timestamp``"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    epoch = int(timestamp.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % bucket_seconds, tz=timezone.utc).replace(tzinfo=None)
+
+
+def _bucket_id(department: str, bucket: datetime) -> str:
+    return f"{department}:{bucket.isoformat()}"
+
+
+def increment_for(ml_prediction: Dict[str, Any]) -> Dict[str, Any]:
+    """$inc document adding one prediction to a bucket"""
+    inc: Dict[str, Any] = {"count": 1, f"risk.{ml_prediction['risk_label']}": 1}
+    for feature, value in ml_prediction.get("shap_explanation", {}).items():
+        inc[f"absShap.{feature}"] = abs(value)
+        inc[f"shap.{feature}"] = value
+    return inc
+
+
+def record(db, department: Optional[str], timestamp: datetime, ml_prediction: Dict[str, Any]):
+    """Add one prediction's SHAP values to its department/time bucket"""
+    department = department or UNKNOWN_DEPARTMENT
+    bucket = bucket_start(timestamp)
+    db[COLLECTION].update_one(
+        {"_id": _bucket_id(department, bucket)},
+        {
+            "$inc": increment_for(ml_prediction),
+            "$setOnInsert": {"department": department, "bucket": bucket},
+        },
+        upsert=True,
+    )
+
+
+def summarize(docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine bucket documents into per-feature means, ranked by mean |SHAP|"""
+    count = 0
+    abs_sums: Dict[str, float] = {}
+    signed_sums: Dict[str, float] = {}
+    risk: Dict[str, int] = {}
+    for doc in docs:
+        count += doc.get("count", 0)
+        for feature, value in doc.get("absShap", {}).items():
+            abs_sums[feature] = abs_sums.get(feature, 0.0) + value
+        for feature, value in doc.get("shap", {}).items():
+            signed_sums[feature] = signed_sums.get(feature, 0.0) + value
+        for label, value in doc.get("risk", {}).items():
+            risk[label] = risk.get(label, 0) + value
+
+    features = [
+        {
+            "feature": feature,
+            "meanAbsShap": abs_sums[feature] / count if count else 0.0,
+            "meanShap": signed_sums.get(feature, 0.0) / count if count else 0.0,
+        }
+        for feature in abs_sums
+    ]
+    features.sort(key=lambda f: f["meanAbsShap"], reverse=True)
+    return {"predictions": count, "riskCounts": risk, "features": features}
+
+
+def get_global_explanations(
+    db,
+    department: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    include_buckets: bool = False,
+) -> Dict[str, Any]:
+    """
+    Global feature importance for a department (all departments when None)
+    over the buckets starting in [since, until)
+    """
+    query: Dict[str, Any] = {}
+    if department:
+        query["department"] = department
+    if since or until:
+        query["bucket"] = {}
+        if since:
+            query["bucket"]["$gte"] = bucket_start(since)
+        if until:
+            query["bucket"]["$lt"] = until
+    docs = list(db[COLLECTION].find(query, {"_id": 0}).sort("bucket", 1))
+
+    result = summarize(docs)
+    result["department"] = department
+    result["bucketSeconds"] = EXPLANATION_BUCKET_SECONDS
+    if include_buckets:
+        result["buckets"] = [
+            {"bucket": doc["bucket"], "department": doc["department"], **summarize([doc])}
+            for doc in docs
+        ]
+    return result
+
+
+def rebuild(db, batch_size: int = 1000) -> int:
+    """
+    Recompute every bucket from the stored mlPredictions
+
+    Used after a re-score (the running sums only ever add). Returns the
+    number of bucket documents written.
+    """
+    from pymongo import ReplaceOne
+
+    buckets: Dict[str, Dict[str, Any]] = {}
+    cursor = db["quiz_submissions"].find(
+        {"mlPrediction": {"$ne": None}},
+        {"department": 1, "submittedAt": 1, "mlPrediction.risk_label": 1, "mlPrediction.shap_explanation": 1},
+    ).batch_size(batch_size)
+    for doc in cursor:
+        department = doc.get("department") or UNKNOWN_DEPARTMENT
+        bucket = bucket_start(doc["submittedAt"])
+        entry = buckets.setdefault(
+            _bucket_id(department, bucket),
+            {"department": department, "bucket": bucket, "count": 0, "absShap": {}, "shap": {}, "risk": {}},
+        )
+        for path, value in increment_for(doc["mlPrediction"]).items():
+            if "." in path:
+                field, key = path.split(".", 1)
+                entry[field][key] = entry[field].get(key, 0) + value
+            else:
+                entry[path] += value
+
+    db[COLLECTION].delete_many({"_id": {"$nin": list(buckets)}})
+    operations = [ReplaceOne({"_id": _id}, doc, upsert=True) for _id, doc in buckets.items()]
+    for start in range(0, len(operations), batch_size):
+        db[COLLECTION].bulk_write(operations[start:start + batch_size], ordered=False)
+    return len(operations)
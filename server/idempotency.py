@@ -0,0 +1,136 @@
+"""
+Idempotent quiz submission
+
+A submission is identified by the client's Idempotency-Key header or, when
+absent, by a hash of the user id, the answers and the quiz id. The first request
+claims the key in ``submission_idempotency`` (unique on _id, expired by a
+TTL index); retries of the same submission find the claim in one indexed
+lookup and get the original response back instead of being scored,
+predicted, inserted and counted again.
+
+A pending claim is a lease of IDEMPOTENCY_LEASE_SECONDS. If its owner dies
+mid-request the next retry takes the claim over once the lease has run
+out, or, when the owner had already stored the submission (the claim
+records its pre-allocated id), completes the claim from that document
+instead of inserting a duplicate.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from settings import settings
+
+COLLECTION = "submission_idempotency"
+SUBMISSIONS = "quiz_submissions"
+
+IDEMPOTENCY_LEASE_SECONDS = settings.idempotency_lease_seconds
+
+# Submission fields echoed in the submit response
+RESPONSE_FIELDS = ["score", "correctAnswers", "totalQuestions", "skillPerformance", "strengths", "weaknesses"]
+
+STATUS_PENDING = "pending"
+STATUS_COMPLETED = "completed"
+
+
+def ensure_indexes(db):
+    """TTL index so keys (and their cached responses) expire after the window"""
+    db[COLLECTION].create_index(
+        "createdAt", expireAfterSeconds=settings.idempotency_ttl_seconds
+    )
+
+
+def submission_key(user_id: str, quiz_submission, header_key: Optional[str] = None) -> str:
+    """Idempotency key scoped to the user: the client-supplied key or a content hash"""
+    if header_key:
+        return f"{user_id}:key:{header_key}"
+    content = {
+        "userId": user_id,
+        "answers": [
+            [a.questionId, a.answer, a.timeSpent] for a in quiz_submission.answers
+        ],
+    }
+    if quiz_submission.quizId:
+        content["quizId"] = quiz_submission.quizId
+    digest = hashlib.sha256(
+        json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return f"{user_id}:sha256:{digest}"
+
+
+def submission_response(submission: Dict[str, Any]) -> Dict[str, Any]:
+    """The /quiz/submit response for a stored submission document"""
+    return {
+        "success": True,
+        "submissionId": str(submission["_id"]),
+        **{field: submission.get(field) for field in RESPONSE_FIELDS},
+        "status": "pending_review",
+        "message": "Quiz submitted for teacher review",
+    }
+
+
+def _lease_expired(claim: Dict[str, Any], now: datetime) -> bool:
+    lease_until = claim.get("leaseUntil") or claim["createdAt"] + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+    return lease_until < now
+
+
+def begin(db, key: str, submission_id: Any) -> Optional[Dict[str, Any]]:
+    """
+    Look up ``key`` and claim it if unused (or its lease has expired)
+
+    ``submission_id`` is the _id the caller will insert its submission
+    under. Returns None when this request now owns the key, otherwise the
+    existing record (completed with its stored response, or still pending).
+    """
+    from pymongo.errors import DuplicateKeyError
+
+    now = datetime.utcnow()
+    claim = {
+        "status": STATUS_PENDING,
+        "createdAt": now,
+        "leaseUntil": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS),
+        "submissionId": submission_id,
+    }
+
+    existing = db[COLLECTION].find_one({"_id": key})
+    if existing is None:
+        try:
+            db[COLLECTION].insert_one({"_id": key, **claim})
+            return None
+        except DuplicateKeyError:
+            # A concurrent retry claimed it between the lookup and the insert
+            return db[COLLECTION].find_one({"_id": key}) or {"_id": key, "status": STATUS_PENDING}
+
+    if existing["status"] != STATUS_PENDING or not _lease_expired(existing, now):
+        return existing
+
+    # The previous owner died; if it got as far as storing the submission, finish its claim
+    previous_id = existing.get("submissionId")
+    if previous_id is not None:
+        stored = db[SUBMISSIONS].find_one({"_id": previous_id}, {field: 1 for field in RESPONSE_FIELDS})
+        if stored is not None:
+            response = submission_response(stored)
+            complete(db, key, response)
+            return {**existing, "status": STATUS_COMPLETED, "response": response}
+
+    # createdAt acts as a version, so only one retry wins the takeover
+    taken = db[COLLECTION].find_one_and_update(
+        {"_id": key, "status": STATUS_PENDING, "createdAt": existing["createdAt"]},
+        {"$set": claim},
+    )
+    if taken is not None:
+        return None
+    return db[COLLECTION].find_one({"_id": key}) or {"_id": key, "status": STATUS_PENDING}
+
+
+def complete(db, key: str, response: Dict[str, Any]):
+    """Store the response to replay for later duplicates"""
+    db[COLLECTION].update_one(
+        {"_id": key},
+        {"$set": {"status": STATUS_COMPLETED, "response": response}},
+    )
+
+
+def release(db, key: str):
+    """Drop a pending claim after a failed attempt so the client can retry"""
+    db[COLLECTION].delete_one({"_id": key, "status": STATUS_PENDING})
@@ -0,0 +1,66 @@
+"""
+Import-time report for server startup
+
+Runs ``python -X importtime -c "import <module>"`` in a fresh interpreter and
+prints the modules that dominate startup, by cumulative and by self time.
+
+Usage:
+    python import_profile.py [--module app] [--top 20]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+
+def profile_imports(module: str) -> Tuple[float, List[Tuple[str, int, int]]]:
+    """Return (wall seconds, [(module, self_us, cumulative_us), ...]) for importing ``module``"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+
+    top_level = [cumulative for name, _, cumulative in rows if name == module]
+    total = (top_level[-1] if top_level else sum(s for _, s, _ in rows)) / 1e6
+    return total, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show what dominates import time")
+    parser.add_argument("--module", default="app", help="module to import (default: app)")
+    parser.add_argument("--top", type=int, default=20, help="rows per table")
+    args = parser.parse_args()
+
+    total, rows = profile_imports(args.module)
+    print(f"import {args.module}: {total * 1000:.1f} ms total, {len(rows)} modules\n")
+
+    # Only top-level packages for the cumulative view, so nested modules don't repeat
+    packages = {}
+    for name, _, cumulative in rows:
+        root = name.split(".")[0]
+        if name == root:
+            packages[root] = max(packages.get(root, 0), cumulative)
+
+    print(f"{'cumulative ms':>14}  package")
+    for name, cumulative in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>14.1f}  {name}")
+
+    print(f"\n{'self ms':>14}  module")
+    for name, self_us, _ in sorted(rows, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"{self_us / 1000:>14.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
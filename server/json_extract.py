@@ -0,0 +1,120 @@
+"""
+Single-pass JSON extraction from LLM output
+
+Gemini answers usually wrap the JSON we asked for in prose or a Markdown
+fence. Instead of a greedy ``\\[.*\\]`` regex (which backtracks on long
+answers and spans from the first bracket to the last), the scanner walks
+the text once, jumping between structural characters, tracks string and
+escape state, and emits each balanced top-level value as soon as it closes.
+Candidates are parsed and schema-validated in one step by pydantic; the
+first one that validates wins.
+
+JSONExtractor keeps its state between feed() calls, so the same scanner
+works on a streamed response chunk by chunk.
+"""
+import re
+from typing import Any, Iterable, List, Optional, Union
+
+from pydantic import TypeAdapter, ValidationError
+
+# Characters that can change the scanner's state
+_STRUCTURAL = re.compile(r'[\[\]{}"\\]')
+_CLOSERS = {"[": "]", "{": "}"}
+
+
+class JSONExtractError(ValueError):
+    """No JSON value in the text matched the expected schema"""
+
+
+class JSONExtractor:
+    """
+    Incremental scanner for balanced JSON arrays/objects embedded in text
+
+    ``openers`` selects which values are candidates: "[" for arrays only,
+    "{" for objects only. Brackets outside a candidate are treated as prose.
+    A value with mismatched brackets is dropped and scanning resumes after it.
+    """
+
+    def __init__(self, openers: str = "[{"):
+        self.openers = openers
+        self._offset = 0  # absolute position of the next chunk
+        self._skip_until = 0  # absolute position after an escaped character
+        self._stack: List[str] = []
+        self._in_string = False
+        self._parts: List[str] = []
+
+    def feed(self, chunk: str) -> List[str]:
+        """Scan ``chunk`` and return the candidate values completed in it"""
+        found = []
+        base = self._offset
+        self._offset += len(chunk)
+        start = 0  # where the open candidate's text begins in this chunk
+
+        for match in _STRUCTURAL.finditer(chunk):
+            i = match.start()
+            if base + i < self._skip_until:
+                continue
+            ch = match.group()
+
+            if not self._stack:
+                if ch in self.openers:
+                    self._stack.append(_CLOSERS[ch])
+                    self._in_string = False
+                    start = i
+                continue
+
+            if self._in_string:
+                if ch == "\\":
+                    self._skip_until = base + i + 2
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in _CLOSERS:
+                self._stack.append(_CLOSERS[ch])
+            elif ch == self._stack[-1]:
+                self._stack.pop()
+                if not self._stack:
+                    self._parts.append(chunk[start:i + 1])
+                    found.append("".join(self._parts))
+                    self._parts = []
+            elif ch in "]}":
+                # Mismatched bracket: not JSON after all
+                self._stack = []
+                self._parts = []
+
+        if self._stack:
+            self._parts.append(chunk[start:])
+        return found
+
+
+def extract_json(
+    source: Union[str, Iterable[str]],
+    schema: Union[TypeAdapter, Any],
+    openers: str = "[{",
+) -> Any:
+    """
+    First JSON value in ``source`` that validates against ``schema``
+
+    ``source`` is the full response text or an iterable of streamed chunks;
+    iteration stops as soon as a valid value is found. ``schema`` is a
+    TypeAdapter or any type pydantic can build one for. Raises
+    JSONExtractError when nothing validates.
+    """
+    adapter = schema if isinstance(schema, TypeAdapter) else TypeAdapter(schema)
+    chunks = [source] if isinstance(source, str) else source
+    extractor = JSONExtractor(openers)
+    last_error: Optional[ValidationError] = None
+
+    for chunk in chunks:
+        for candidate in extractor.feed(chunk):
+            try:
+                return adapter.validate_json(candidate)
+            except ValidationError as e:
+                last_error = e
+
+    if last_error is not None:
+        raise JSONExtractError(f"No JSON value matched the expected schema: {last_error}")
+    raise JSONExtractError("No JSON value found in the response")
@@ -0,0 +1,282 @@
+"""
+Resilient Gemini call layer
+
+Every LLM call gets a deadline, jittered exponential-backoff retries limited
+by a shared retry budget, and a circuit breaker that fails fast while the
+provider is degraded. Optionally a hedged duplicate request is sent once the
+primary has been outstanding longer than the recent p95 latency.
+"""
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
+
+from settings import settings
+from tracing import KIND_CLIENT, traced
+
+GEMINI_API_KEY = settings.gemini_api_key
+GEMINI_URL = "https://generativelanguage.googleapis.com/v1/models/gemini-2.5-flash:generateContent"
+
+LLM_DEADLINE_SECONDS = settings.llm_deadline_seconds
+LLM_MAX_ATTEMPTS = settings.llm_max_attempts
+# Retries allowed per original request, averaged over time
+LLM_RETRY_BUDGET_RATIO = settings.llm_retry_budget_ratio
+LLM_BREAKER_FAILURES = settings.llm_breaker_failures
+LLM_BREAKER_RESET_SECONDS = settings.llm_breaker_reset_seconds
+
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+# Hedge delay used until enough latencies have been observed
+DEFAULT_HEDGE_DELAY_SECONDS = 5.0
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """
+    An LLM call failed
+
+    ``provider_failure`` says whether the failure counts against the
+    provider's health in the circuit breaker; it defaults to ``retryable``
+    (a bad request or unparsable body means the provider did answer).
+    """
+
+    def __init__(self, message: str, retryable: bool = False, provider_failure: Optional[bool] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.provider_failure = retryable if provider_failure is None else provider_failure
+
+
+class LLMTimeoutError(LLMError):
+    """The call's deadline passed before a response arrived; always a provider failure"""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message, retryable=retryable, provider_failure=True)
+
+
+class LLMUnavailableError(LLMError):
+    """The circuit breaker is open; the provider is being given time to recover"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to a fraction of overall traffic
+
+    Each original request deposits ``ratio`` tokens and each retry spends one,
+    so a provider outage cannot multiply load by the number of attempts.
+    """
+
+    def __init__(self, ratio: float = LLM_RETRY_BUDGET_RATIO, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe"""
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, reset_timeout: float = LLM_BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """Raise LLMUnavailableError unless a call may go through"""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed >= self.reset_timeout and not self.probing:
+                self.probing = True
+                return
+            raise LLMUnavailableError(
+                "LLM provider circuit is open", retry_after=max(1.0, self.reset_timeout - elapsed)
+            )
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+class LatencyTracker:
+    """Recent successful-call latencies for the hedge delay"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < 20:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+retry_budget = RetryBudget()
+breaker = CircuitBreaker()
+latencies = LatencyTracker()
+_session = None
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+
+
+def _get_session():
+    """Pooled HTTP session; requests is imported on first use to keep startup lean"""
+    global _session
+    if _session is None:
+        import requests
+
+        _session = requests.Session()
+    return _session
+
+
+def _post_gemini(prompt: str, timeout: float) -> str:
+    """One HTTP attempt; raises LLMError with retryability set"""
+    import requests
+
+    payload = {"contents": [{"parts": [{"text": prompt}]}]}
+    try:
+        response = _get_session().post(
+            GEMINI_URL,
+            # In a header, not the query string: requests puts the URL in its exception text
+            headers={"Content-Type": "application/json", "x-goog-api-key": GEMINI_API_KEY},
+            json=payload,
+            timeout=timeout,
+        )
+    except requests.Timeout as e:
+        raise LLMTimeoutError(f"Gemini request timed out: {str(e)}", retryable=True)
+    except requests.RequestException as e:
+        raise LLMError(f"Gemini request failed: {str(e)}", retryable=True)
+
+    if response.status_code != 200:
+        raise LLMError(
+            f"Gemini API error {response.status_code}: {response.text}",
+            retryable=response.status_code in RETRYABLE_STATUS,
+        )
+
+    try:
+        data = response.json()
+        return data["candidates"][0]["content"]["parts"][0]["text"]
+    except (ValueError, KeyError, IndexError) as e:
+        raise LLMError(f"Unexpected Gemini response: {str(e)}")
+
+
+@traced("llm.attempt", KIND_CLIENT)
+def _attempt(prompt: str, deadline: float, hedge: bool) -> str:
+    """One attempt, optionally hedged with a second request after the p95 delay"""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise LLMTimeoutError("LLM deadline exceeded", retryable=False)
+
+    if not hedge:
+        return _post_gemini(prompt, remaining)
+
+    hedge_delay = latencies.percentile(0.95) or DEFAULT_HEDGE_DELAY_SECONDS
+    # Each in a copy of this context, so the pool thread keeps the active span and trace id
+    primary = _hedge_pool.submit(contextvars.copy_context().run, _post_gemini, prompt, remaining)
+    done, _ = wait([primary], timeout=min(hedge_delay, remaining))
+    if done:
+        return primary.result()
+
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        primary.cancel()
+        raise LLMTimeoutError("LLM deadline exceeded", retryable=False)
+    secondary = _hedge_pool.submit(contextvars.copy_context().run, _post_gemini, prompt, remaining)
+    pending = {primary, secondary}
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            raise LLMTimeoutError("LLM deadline exceeded", retryable=False)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+@traced("llm.call_gemini")
+def call_gemini(prompt: str, deadline_seconds: float = LLM_DEADLINE_SECONDS, hedge: bool = False) -> str:
+    """
+    Call Gemini and return the generated text
+
+    Raises LLMUnavailableError when the breaker is open, LLMTimeoutError when
+    the deadline passes, and LLMError for other failures.
+    """
+    breaker.before_call()
+    retry_budget.deposit()
+    deadline = time.monotonic() + deadline_seconds
+
+    attempt = 0
+    while True:
+        attempt += 1
+        started = time.monotonic()
+        try:
+            text = _attempt(prompt, deadline, hedge)
+        except LLMError as e:
+            if e.provider_failure:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            retryable = e.retryable and attempt < LLM_MAX_ATTEMPTS
+            if not retryable or not retry_budget.try_spend():
+                raise
+            # Full jitter keeps synchronised clients from retrying in lockstep
+            backoff = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)))
+            if time.monotonic() + backoff >= deadline:
+                raise
+            time.sleep(backoff)
+            breaker.before_call()
+            continue
+        except BaseException:
+            # Unexpected errors must still end a half-open probe
+            breaker.record_failure()
+            raise
+
+        breaker.record_success()
+        latencies.record(time.monotonic() - started)
+        return text
@@ -0,0 +1,204 @@
+"""
+Structured, non-blocking logging
+
+Application loggers only put records on an in-memory queue (QueueHandler);
+a QueueListener thread formats them as JSON lines (or plain text) and does
+the stdout write, so request handlers never wait on a write syscall.
+
+Configuration (settings / environment):
+
+    LOG_LEVEL               root level (default INFO)
+    LOG_LEVELS              per-logger overrides, e.g. "ml_service=DEBUG,pymongo=WARNING"
+    LOG_FORMAT              "json" (default) or "text"
+    LOG_DEBUG_SAMPLE_EVERY  keep 1 in N DEBUG records per call site (default 100, 1 = all)
+
+Every record is passed through redact() before it is written: configured
+secrets (Gemini key, JWT secret, Mongo password) and anything that looks
+like an API key, bearer token or URI credential are masked.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from settings import settings
+from tracing import current_trace_id
+
+REDACTED = "[REDACTED]"
+
+# (pattern, replacement) pairs; groups keep the non-secret context
+_SECRET_PATTERNS = [
+    (re.compile(r"AIza[0-9A-Za-z_\-]{35}"), REDACTED),  # Google API keys
+    (re.compile(r"(?i)(bearer\s+)[A-Za-z0-9_\-\.=]+"), r"\1" + REDACTED),
+    (re.compile(r"(?i)([?&](?:key|api_key|apikey|token|access_token)=)[^&\s\"']+"), r"\1" + REDACTED),
+    (re.compile(r"(?i)((?:password|passwd|secret|api_key|apikey)[\"']?\s*[:=]\s*[\"']?)[^\s,\"'&}]+"), r"\1" + REDACTED),
+    (re.compile(r"(mongodb(?:\+srv)?://[^:/\s]+:)[^@\s]+(@)"), r"\1" + REDACTED + r"\2"),
+]
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def _configured_secrets():
+    secrets = [settings.gemini_api_key, settings.jwt_secret]
+    uri = settings.mongodb_uri or ""
+    match = re.match(r"mongodb(?:\+srv)?://[^:/\s]+:([^@\s]+)@", uri)
+    if match:
+        secrets.append(match.group(1))
+    return [s for s in secrets if s and len(s) >= 8]
+
+
+_SECRETS = _configured_secrets()
+
+
+def redact(text: str) -> str:
+    """Mask configured secrets and credential-looking substrings"""
+    for secret in _SECRETS:
+        if secret in text:
+            text = text.replace(secret, REDACTED)
+    for pattern, replacement in _SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = redact(self.formatException(record.exc_info))
+        elif record.exc_text:
+            entry["exception"] = redact(record.exc_text)
+        return json.dumps(entry, default=str)
+
+
+class RedactingFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+class DebugSampler(logging.Filter):
+    """Keep every record above DEBUG but only 1 in ``every`` DEBUG records per call site"""
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self._counts: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % self.every == 0:
+            record.sampled = self.every
+            return True
+        return False
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting (and redaction) to the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args now (they may be mutated after the call) but skip formatting
+        record.msg = record.getMessage()
+        record.args = None
+        # The active span lives in a contextvar, so read it on the calling thread
+        if not hasattr(record, "trace_id"):
+            trace_id = current_trace_id()
+            if trace_id:
+                record.trace_id = trace_id
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+_output_handler: Optional[logging.Handler] = None
+_installed = False
+
+
+def parse_levels(spec: Optional[str]) -> Dict[str, str]:
+    """"a=DEBUG,b.c=WARNING" -> {"a": "DEBUG", "b.c": "WARNING"}"""
+    levels = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _start_listener():
+    global _listener
+    _listener = logging.handlers.QueueListener(_queue, _output_handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _restart_after_fork():
+    # Threads don't survive fork(): each gunicorn worker needs its own listener
+    global _queue
+    if _listener is None:
+        return
+    _queue = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, _QueueHandler):
+            handler.queue = _queue
+    _start_listener()
+
+
+def setup_logging():
+    """Install the queue-based pipeline on the root logger and start the listener (idempotent)"""
+    global _output_handler, _installed
+    if not _installed:
+        _output_handler = logging.StreamHandler(sys.stdout)
+        _output_handler.setFormatter(
+            JSONFormatter()
+            if settings.log_format == "json"
+            else RedactingFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+
+        queue_handler = _QueueHandler(_queue)
+        queue_handler.addFilter(DebugSampler(settings.log_debug_sample_every))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(settings.log_level.upper())
+        for name, level in parse_levels(settings.log_levels).items():
+            logging.getLogger(name).setLevel(level)
+
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_restart_after_fork)
+        _installed = True
+
+    if _listener is None:
+        _start_listener()
+
+
+def shutdown_logging():
+    """Flush queued records (lifespan shutdown)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
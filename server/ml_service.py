@@ -1,35 +1,74 @@
 """
 ML Service for Quiz Analysis with SHAP and LIME Explanations
 """
+import logging
 import numpy as np
 from typing import Dict, List, Any
 import pickle
-import os
+
+from settings import settings
+from tracing import traced
+from tree_inference import compile_tree_model
+
+from features import FEATURE_SET_VERSION, model_feature_names
+
+# Column order of the model's feature vector (versioned, see features.py)
+FEATURE_NAMES = model_feature_names(FEATURE_SET_VERSION)
+
+logger = logging.getLogger(__name__)
+
+RISK_LABELS = ["Low Risk", "Medium Risk", "High Risk"]
+
+# Path to a pickled DecisionTree/RandomForest; the mock model is used when unset
+MODEL_PATH = settings.model_path
 
 # For now, we'll use a mock model. You can replace this with your trained model.
 class MockMLModel:
     """Mock ML model for demonstration. Replace with your trained DecisionTree/RandomForest"""
-    
+
+    _PROBA = np.array([
+        [0.8, 0.15, 0.05],  # Low risk
+        [0.2, 0.6, 0.2],    # Medium risk
+        [0.1, 0.2, 0.7],    # High risk
+    ])
+
+    def _risk(self, X):
+        # Simple rule-based mock prediction on overall_accuracy
+        accuracy = np.asarray(X, dtype=np.float64)[:, 0]
+        return np.where(accuracy >= 0.7, 0, np.where(accuracy >= 0.5, 1, 2))
+
     def predict(self, X):
         """Predict risk level: 0=Low, 1=Medium, 2=High"""
-        # Simple rule-based mock prediction
-        accuracy = X[0][0]  # overall_accuracy
-        if accuracy >= 0.7:
-            return np.array([0])  # Low risk
-        elif accuracy >= 0.5:
-            return np.array([1])  # Medium risk
-        else:
-            return np.array([2])  # High risk
-    
+        return self._risk(X)
+
     def predict_proba(self, X):
         """Predict probability distribution"""
-        accuracy = X[0][0]
-        if accuracy >= 0.7:
-            return np.array([[0.8, 0.15, 0.05]])
-        elif accuracy >= 0.5:
-            return np.array([[0.2, 0.6, 0.2]])
-        else:
-            return np.array([[0.1, 0.2, 0.7]])
+        return self._PROBA[self._risk(X)]
+
+
+_model = None
+
+
+def load_model(path: str):
+    """
+    Unpickle a risk model
+
+    sklearn tree models are compiled into flat arrays so single-row
+    predictions skip sklearn's per-call overhead.
+    """
+    with open(path, "rb") as f:
+        model = pickle.load(f)
+    if hasattr(model, "tree_") or hasattr(model, "estimators_"):
+        model = compile_tree_model(model)
+    return model
+
+
+def get_model():
+    """Load the risk model at MODEL_PATH (or the mock model) once per process"""
+    global _model
+    if _model is None:
+        _model = load_model(MODEL_PATH) if MODEL_PATH else MockMLModel()
+    return _model
 
 
 def extract_features(quiz_data: Dict[str, Any]) -> Dict[str, float]:
@@ -40,17 +79,8 @@ def extract_features(quiz_data: Dict[str, Any]) -> Dict[str, float]:
     """
     ml_analytics = quiz_data.get("mlAnalytics", {})
     
-    features = {
-        "overall_accuracy": ml_analytics.get("overall_accuracy", 0.0),
-        "cognitive_accuracy": ml_analytics.get("cognitive_accuracy", 0.0),
-        "emotional_accuracy": ml_analytics.get("emotional_accuracy", 0.0),
-        "behavioural_accuracy": ml_analytics.get("behavioural_accuracy", 0.0),
-        "avg_time_spent": ml_analytics.get("avg_time_spent", 0.0),
-        "negative_coping_responses": float(ml_analytics.get("negative_coping_responses", 0)),
-        "emotional_regulation_score": ml_analytics.get("emotional_regulation_score", 0.0),
-        "attention_variance": ml_analytics.get("attention_variance", 0.0),
-    }
-    print("Extracted features for ML model:", features)
+    features = {name: float(ml_analytics.get(name, 0.0)) for name in FEATURE_NAMES}
+    logger.debug("Extracted features for ML model", extra={"features": features})
     return features
 
 
@@ -141,55 +171,49 @@ def generate_lime_explanation(model, features: Dict[str, float], feature_vector:
     return lime_explanation
 
 
-def predict_student_risk(quiz_submission: Dict[str, Any]) -> Dict[str, Any]:
+_model_version = None
+
+
+def model_file_version(path: str) -> str:
+    """Short content hash identifying a pickled model file"""
+    import hashlib
+
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def get_model_version() -> str:
     """
-    Main function to predict student risk with XAI explanations
-    
-    Returns:
-        {
-            "predicted_risk": int (0=Low, 1=Medium, 2=High),
-            "risk_label": str,
-            "confidence": float,
-            "features": dict,
-            "shap_explanation": dict,
-            "lime_explanation": dict
-        }
+    Identifier stored with every prediction
+
+    MODEL_VERSION if set, else a hash of the MODEL_PATH file ("mock" for the
+    mock model), suffixed with the feature set the model consumes.
     """
-    # Load or initialize model (in production, load your trained model)
-    # model = pickle.load(open("model.pkl", "rb"))
-    model = MockMLModel()
-    
-    # Extract features
-    features = extract_features(quiz_submission)
-    
-    # Prepare feature vector
-    feature_vector = [
-        features["overall_accuracy"],
-        features["cognitive_accuracy"],
-        features["emotional_accuracy"],
-        features["behavioural_accuracy"],
-        features["avg_time_spent"],
-        features["negative_coping_responses"],
-        features["emotional_regulation_score"],
-        features["attention_variance"],
-    ]
-    
-    X_student = [feature_vector]
-    
-    # Predict risk level
-    prediction = model.predict(X_student)[0]
-    probabilities = model.predict_proba(X_student)[0]
-    
-    risk_labels = ["Low Risk", "Medium Risk", "High Risk"]
-    
+    global _model_version
+    if _model_version is None:
+        if settings.model_version:
+            base = settings.model_version
+        elif MODEL_PATH:
+            base = model_file_version(MODEL_PATH)
+        else:
+            base = "mock"
+        _model_version = f"{base}+{FEATURE_SET_VERSION}"
+    return _model_version
+
+
+def _prediction_record(model, features: Dict[str, float], probabilities) -> Dict[str, Any]:
+    """mlPrediction document for one feature dict and its class probabilities"""
+    prediction = int(np.argmax(probabilities))
+    feature_vector = [features[name] for name in FEATURE_NAMES]
+
     # Generate explanations
     shap_explanation = generate_shap_explanation(model, features)
     lime_explanation = generate_lime_explanation(model, features, feature_vector)
     
     # Compile result
-    result = {
+    return {
         "predicted_risk": int(prediction),
-        "risk_label": risk_labels[int(prediction)],
+        "risk_label": RISK_LABELS[int(prediction)],
         "confidence": float(probabilities[int(prediction)]),
         "probabilities": {
             "low": float(probabilities[0]),
@@ -197,52 +221,60 @@ def predict_student_risk(quiz_submission: Dict[str, Any]) -> Dict[str, Any]:
             "high": float(probabilities[2])
         },
         "features": features,
+        "featureSet": FEATURE_SET_VERSION,
+        "modelVersion": get_model_version(),
         "shap_explanation": shap_explanation,
         "lime_explanation": lime_explanation
     }
-    
-    return result
 
 
-def format_ml_insights_for_gemini(ml_prediction: Dict[str, Any]) -> str:
+@traced("ml.predict_student_risk")
+def predict_student_risk(quiz_submission: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Format ML prediction and explanations for Gemini prompt
+    Main function to predict student risk with XAI explanations
+    
+    Returns:
+        {
+            "predicted_risk": int (0=Low, 1=Medium, 2=High),
+            "risk_label": str,
+            "confidence": float,
+            "features": dict,
+            "shap_explanation": dict,
+            "lime_explanation": dict
+        }
     """
-    risk_label = ml_prediction["risk_label"]
-    confidence = ml_prediction["confidence"] * 100
+    model = get_model()
     
-    # Top SHAP features (sorted by absolute value)
-    shap_items = sorted(
-        ml_prediction["shap_explanation"].items(),
-        key=lambda x: abs(x[1]),
-        reverse=True
-    )[:3]
+    # Extract features
+    features = extract_features(quiz_submission)
     
-    shap_text = "\n".join([f"  - {k}: {v:+.3f}" for k, v in shap_items])
+    # Prepare feature vector
+    feature_vector = [features[name] for name in FEATURE_NAMES]
     
-    # LIME rules
-    lime_text = "\n".join([f"  - {k}: weight {v:+.3f}" for k, v in ml_prediction["lime_explanation"].items()])
+    X_student = [feature_vector]
     
-    prompt = f"""
-        ML Model Analysis Results:
-
-        Risk Assessment: {risk_label} (confidence: {confidence:.1f}%)
+    # Predict risk level (a single model call; the class is the argmax)
+    probabilities = model.predict_proba(X_student)[0]
+    result = _prediction_record(model, features, probabilities)
 
-        SHAP Feature Importance (Top Contributing Factors):
-        {shap_text}
+    # Feed the streaming drift monitor (histogram bumps only)
+    from drift_monitor import get_drift_monitor
+    get_drift_monitor().observe(feature_vector, result["predicted_risk"])
+    
+    return result
 
-        LIME Explanation (Human-Readable Rules):
-        {lime_text}
 
-        Key Metrics:
-        - Overall Accuracy: {ml_prediction['features']['overall_accuracy']:.2%}
-        - Cognitive Accuracy: {ml_prediction['features']['cognitive_accuracy']:.2%}
-        - Emotional Accuracy: {ml_prediction['features']['emotional_accuracy']:.2%}
-        - Emotional Regulation Score: {ml_prediction['features']['emotional_regulation_score']:.2%}
-        - Negative Coping Responses: {ml_prediction['features']['negative_coping_responses']}
-        - Attention Variance: {ml_prediction['features']['attention_variance']:.2f}
+def predict_risk_batch(X) -> List[Dict[str, Any]]:
+    """
+    mlPrediction documents for a feature matrix in FEATURE_NAMES column order
 
-        Based on these ML insights and explainability analysis, provide:
-        """
-    
-    return prompt
+    One predict_proba call for all rows. Unlike predict_student_risk this
+    does not feed the drift monitor, so it is safe for re-scoring history.
+    """
+    model = get_model()
+    X = np.ascontiguousarray(X, dtype=np.float64).reshape(-1, len(FEATURE_NAMES))
+    probabilities = np.asarray(model.predict_proba(X))
+    return [
+        _prediction_record(model, dict(zip(FEATURE_NAMES, row)), p)
+        for row, p in zip(X.tolist(), probabilities)
+    ]
@@ -0,0 +1,239 @@
+"""
+Token-budgeted prompt builder for teacher analysis prompts
+
+One precompiled template shared by the single and bulk teacher-submit routes.
+Whitespace is normalised once at import, only the top-k SHAP and LIME factors
+are embedded, and prompts are shrunk until they fit PROMPT_TOKEN_BUDGET.
+The size of every built prompt is recorded in ``prompt_stats``.
+"""
+import re
+import threading
+from string import Template
+from typing import Any, Dict, List, Optional
+
+from settings import settings
+
+PROMPT_TOKEN_BUDGET = settings.prompt_token_budget
+PROMPT_TOP_K = settings.prompt_top_k
+
+# Rough chars-per-token ratio for English prose with Gemini/GPT tokenizers
+CHARS_PER_TOKEN = 4
+
+_BLANK_RUNS = re.compile(r"\n{3,}")
+_INLINE_SPACE = re.compile(r"[ \t]+")
+
+
+def normalize_whitespace(text: str) -> str:
+    """Strip indentation and trailing space, collapse runs of blank lines"""
+    lines = [_INLINE_SPACE.sub(" ", line).strip() for line in text.strip().splitlines()]
+    return _BLANK_RUNS.sub("\n\n", "\n".join(lines))
+
+
+def _compile(text: str) -> Template:
+    return Template(normalize_whitespace(text))
+
+
+SUBMISSION_TEMPLATE = _compile("""
+    Score: ${score}%
+    Correct Answers: ${correct}/${total}
+
+    Skill Performance:
+    - Cognitive: ${cognitive}
+    - Emotional: ${emotional}
+    - Behavioural: ${behavioural}
+
+    Teacher Comments: ${comments}
+""")
+
+RECOMMENDATION_TEMPLATE = _compile("""
+    Based on the following quiz results, provide personalized learning recommendations:
+
+    ${submission}
+
+    Provide:
+    1. 3-5 specific, actionable recommendations for improvement that incorporate the ML insights
+    2. A brief explanation of the student's performance pattern considering the risk assessment and feature importance
+    3. Address the key factors identified by SHAP and LIME explanations
+
+    Format as JSON:
+    {"recommendations": ["recommendation1", "recommendation2", ...], "explanation": "explanation text"}
+""")
+
+BATCH_RECOMMENDATION_TEMPLATE = _compile("""
+    Provide personalized learning recommendations for each of the following ${count} quiz submissions.
+    For every submission:
+    1. 3-5 specific, actionable recommendations for improvement that incorporate the ML insights
+    2. A brief explanation of the student's performance pattern considering the risk assessment and feature importance
+    3. Address the key factors identified by SHAP and LIME explanations
+
+    Respond with only a JSON array containing one object per submission:
+    [{"submissionId": "<id>", "recommendations": ["recommendation1", ...], "explanation": "explanation text"}, ...]
+
+    ${submissions}
+""")
+
+BATCH_ENTRY_TEMPLATE = Template("### Submission ${submission_id}\n${submission}")
+
+ML_INSIGHTS_TEMPLATE = _compile("""
+    ML Risk Assessment: ${risk_label} (confidence: ${confidence}%)
+    Top SHAP factors: ${shap}
+    LIME rules: ${lime}
+    Metrics: overall ${overall}, cognitive ${cognitive}, emotional ${emotional}, regulation ${regulation}, negative coping ${negative_coping}, attention variance ${attention_variance}
+""")
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class PromptStats:
+    """Running size statistics of built prompts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_chars = 0
+        self.total_tokens = 0
+        self.max_tokens = 0
+        self.over_budget = 0
+
+    def record(self, text: str, budget: int):
+        tokens = estimate_tokens(text)
+        with self._lock:
+            self.count += 1
+            self.total_chars += len(text)
+            self.total_tokens += tokens
+            self.max_tokens = max(self.max_tokens, tokens)
+            if tokens > budget:
+                self.over_budget += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "prompts": self.count,
+                "avgChars": self.total_chars / self.count if self.count else 0,
+                "avgTokens": self.total_tokens / self.count if self.count else 0,
+                "maxTokens": self.max_tokens,
+                "overBudget": self.over_budget,
+            }
+
+
+prompt_stats = PromptStats()
+
+
+def _top_factors(explanation: Dict[str, float], k: int) -> List:
+    return sorted(explanation.items(), key=lambda item: abs(item[1]), reverse=True)[:k]
+
+
+def format_ml_insights(ml_prediction: Optional[Dict[str, Any]], top_k_shap: int, top_k_lime: int) -> str:
+    """Compact ML section keeping only the top-k SHAP and LIME factors"""
+    if not ml_prediction:
+        return ""
+    features = ml_prediction["features"]
+    shap = ", ".join(f"{k} {v:+.2f}" for k, v in _top_factors(ml_prediction["shap_explanation"], top_k_shap))
+    lime = ", ".join(f"{k} ({v:+.2f})" for k, v in _top_factors(ml_prediction["lime_explanation"], top_k_lime))
+    return ML_INSIGHTS_TEMPLATE.substitute(
+        risk_label=ml_prediction["risk_label"],
+        confidence=f"{ml_prediction['confidence'] * 100:.0f}",
+        shap=shap or "none",
+        lime=lime or "none",
+        overall=f"{features['overall_accuracy']:.0%}",
+        cognitive=f"{features['cognitive_accuracy']:.0%}",
+        emotional=f"{features['emotional_accuracy']:.0%}",
+        regulation=f"{features['emotional_regulation_score']:.0%}",
+        negative_coping=f"{features['negative_coping_responses']:g}",
+        attention_variance=f"{features['attention_variance']:.2f}",
+    )
+
+
+def _skill(skill_performance: Dict[str, Dict[str, int]], name: str) -> str:
+    perf = skill_performance.get(name, {"correct": 0, "total": 0})
+    return f"{perf['correct']}/{perf['total']}"
+
+
+def _render_submission(submission: Dict[str, Any], top_k_shap: int, top_k_lime: int, comment_chars: Optional[int]) -> str:
+    comments = normalize_whitespace(submission.get("teacherComments") or "") or "None"
+    if comment_chars is not None and len(comments) > comment_chars:
+        comments = comments[:comment_chars].rstrip() + "..."
+    skill_performance = submission["skillPerformance"]
+    section = SUBMISSION_TEMPLATE.substitute(
+        score=submission["score"],
+        correct=submission["correctAnswers"],
+        total=submission["totalQuestions"],
+        cognitive=_skill(skill_performance, "Cognitive"),
+        emotional=_skill(skill_performance, "Emotional"),
+        behavioural=_skill(skill_performance, "Behavioural"),
+        comments=comments,
+    )
+    ml_insights = format_ml_insights(submission.get("mlPrediction"), top_k_shap, top_k_lime)
+    return f"{section}\n\n{ml_insights}" if ml_insights else section
+
+
+def build_submission_section(submission: Dict[str, Any], token_budget: int, top_k: int = PROMPT_TOP_K) -> str:
+    """
+    Per-submission part of a prompt, shrunk to ``token_budget``
+
+    The LIME and SHAP factor lists are trimmed first, then the teacher
+    comments are truncated.
+    """
+    top_k_shap = top_k_lime = top_k
+    comment_chars = None
+    section = _render_submission(submission, top_k_shap, top_k_lime, comment_chars)
+
+    while estimate_tokens(section) > token_budget:
+        if top_k_lime > 1:
+            top_k_lime -= 1
+        elif top_k_shap > 1:
+            top_k_shap -= 1
+        elif comment_chars is None or comment_chars > 80:
+            overflow = (estimate_tokens(section) - token_budget) * CHARS_PER_TOKEN
+            current = len(normalize_whitespace(submission.get("teacherComments") or ""))
+            comment_chars = max(80, (comment_chars or current) - overflow)
+        else:
+            break
+        section = _render_submission(submission, top_k_shap, top_k_lime, comment_chars)
+    return section
+
+
+_RECOMMENDATION_OVERHEAD = estimate_tokens(RECOMMENDATION_TEMPLATE.substitute(submission=""))
+
+
+def build_recommendation_prompt(
+    submission: Dict[str, Any],
+    token_budget: int = PROMPT_TOKEN_BUDGET,
+    top_k: int = PROMPT_TOP_K,
+) -> str:
+    """
+    Recommendation prompt for one quiz submission document, fitted to ``token_budget``
+    """
+    section = build_submission_section(submission, token_budget - _RECOMMENDATION_OVERHEAD, top_k)
+    prompt = RECOMMENDATION_TEMPLATE.substitute(submission=section)
+    prompt_stats.record(prompt, token_budget)
+    return prompt
+
+
+def build_batch_recommendation_prompt(
+    submissions: List[Dict[str, Any]],
+    token_budget: int = PROMPT_TOKEN_BUDGET,
+    top_k: int = PROMPT_TOP_K,
+) -> str:
+    """
+    One prompt covering several submissions with a shared instruction header
+
+    Each submission is labelled with its string ``_id`` and gets the
+    per-submission share of the budget it would have had on its own. The
+    model is asked for a JSON array keyed by submissionId.
+    """
+    section_budget = token_budget - _RECOMMENDATION_OVERHEAD
+    entries = [
+        BATCH_ENTRY_TEMPLATE.substitute(
+            submission_id=str(submission["_id"]),
+            submission=build_submission_section(submission, section_budget, top_k),
+        )
+        for submission in submissions
+    ]
+    prompt = BATCH_RECOMMENDATION_TEMPLATE.substitute(
+        count=len(submissions), submissions="\n\n".join(entries)
+    )
+    prompt_stats.record(prompt, token_budget * len(submissions))
+    return prompt
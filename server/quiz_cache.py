@@ -0,0 +1,144 @@
+"""
+Server-side quiz cache and compact answer storage
+
+Submissions reference the ``quizzes`` document written by /quiz/generate
+instead of trusting (and copying) the question list sent by the client.
+The quiz is loaded once per worker into an LRU cache in a precompiled form
+(option lists, correct-answer index, skill type per question), and each
+submission stores only parallel per-answer arrays:
+
+    responses = {
+        "q": [question index, ...],
+        "a": [chosen option index, -1 if not one of the options, ...],
+        "c": [1 if correct else 0, ...],
+        "t": [seconds spent, ...],
+        "x": {"<position>": answer text},     only for answers with a == -1
+    }
+
+Free-text answers are kept so features that look at the answer wording
+(negative-coping keywords) can be recomputed from stored submissions.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from settings import settings
+
+QUIZ_CACHE_SIZE = settings.quiz_cache_size
+
+QUIZ_PROJECTION = {"userId": 1, "questions": 1}
+
+# Skill types whose answers count as coping responses in mlAnalytics
+COPING_SKILL_TYPES = ("Emotional", "Behavioural")
+
+
+def _normalize_skill_type(skill_type: str) -> str:
+    # Handle both British and American spelling
+    return "Behavioural" if skill_type == "Behavioral" else skill_type
+
+
+class GradedAnswers:
+    """Per-answer arrays for the answers that matched a quiz question"""
+
+    def __init__(self):
+        self.question_index: List[int] = []
+        self.answer_index: List[int] = []
+        self.correct: List[bool] = []
+        self.time_spent: List[int] = []
+        self.answer_text: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self.question_index)
+
+    def to_document(self) -> Dict[str, Any]:
+        document = {
+            "q": self.question_index,
+            "a": self.answer_index,
+            "c": [int(c) for c in self.correct],
+            "t": self.time_spent,
+        }
+        free_text = {
+            str(position): text
+            for position, (index, text) in enumerate(zip(self.answer_index, self.answer_text))
+            if index < 0 and text
+        }
+        if free_text:
+            document["x"] = free_text
+        return document
+
+
+class CompiledQuiz:
+    """A quiz's questions flattened into lookup lists for grading"""
+
+    def __init__(self, quiz_id: Optional[str], user_id: Optional[str], questions: List[Dict[str, Any]]):
+        self.quiz_id = quiz_id
+        self.user_id = user_id
+        self.question_ids = [q["id"] for q in questions]
+        self.index_by_id = {qid: i for i, qid in enumerate(self.question_ids)}
+        self.options = [list(q.get("options", [])) for q in questions]
+        self.correct_answers = [q.get("correctAnswer", "") for q in questions]
+        self.skill_types = [_normalize_skill_type(q.get("skillType", "Cognitive")) for q in questions]
+        self.coping = [q.get("skillType") in COPING_SKILL_TYPES for q in questions]
+
+    def __len__(self) -> int:
+        return len(self.question_ids)
+
+    @classmethod
+    def from_document(cls, doc: Dict[str, Any]) -> "CompiledQuiz":
+        return cls(str(doc["_id"]), doc.get("userId"), doc.get("questions", []))
+
+    def grade(self, answers) -> GradedAnswers:
+        """Grade QuizAnswer models; answers to unknown question ids are dropped"""
+        graded = GradedAnswers()
+        for answer in answers:
+            i = self.index_by_id.get(answer.questionId)
+            if i is None:
+                continue
+            options = self.options[i]
+            graded.question_index.append(i)
+            graded.answer_index.append(options.index(answer.answer) if answer.answer in options else -1)
+            graded.correct.append(answer.answer == self.correct_answers[i])
+            graded.time_spent.append(answer.timeSpent)
+            graded.answer_text.append(answer.answer)
+        return graded
+
+
+class QuizCache:
+    """Thread-safe LRU of compiled quizzes keyed by quiz id"""
+
+    def __init__(self, max_size: int = QUIZ_CACHE_SIZE):
+        self.max_size = max_size
+        self._quizzes: "OrderedDict[str, CompiledQuiz]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, quiz: CompiledQuiz):
+        with self._lock:
+            self._quizzes[quiz.quiz_id] = quiz
+            self._quizzes.move_to_end(quiz.quiz_id)
+            while len(self._quizzes) > self.max_size:
+                self._quizzes.popitem(last=False)
+
+    def get(self, db, quiz_id: str) -> Optional[CompiledQuiz]:
+        """Cached quiz, loading it from ``quizzes`` on a miss; None if it doesn't exist"""
+        with self._lock:
+            quiz = self._quizzes.get(quiz_id)
+            if quiz is not None:
+                self._quizzes.move_to_end(quiz_id)
+                return quiz
+
+        from bson import ObjectId
+        from bson.errors import InvalidId
+
+        try:
+            object_id = ObjectId(quiz_id)
+        except InvalidId:
+            return None
+        doc = db["quizzes"].find_one({"_id": object_id}, QUIZ_PROJECTION)
+        if doc is None:
+            return None
+        quiz = CompiledQuiz.from_document(doc)
+        self.put(quiz)
+        return quiz
+
+
+quiz_cache = QuizCache()
@@ -1,23 +1,27 @@
 from datetime import datetime, timedelta
-import os
-from fastapi.responses import JSONResponse
-import jwt
-from dotenv import load_dotenv
+from functools import lru_cache
+from serialization import FastJSONResponse
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 
 from fastapi import APIRouter, Depends, HTTPException, Request
 import uuid
 
 from routes.get_user import get_current_user
+from settings import settings
 
-load_dotenv()
-SECRET_KEY = os.getenv("JWT_SECRET")
-ALGORITHM = os.getenv("ALGORITHM")
+SECRET_KEY = settings.jwt_secret
+ALGORITHM = settings.jwt_algorithm
 auth_router = APIRouter(prefix="/auth", tags=["Authentication"])
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+@lru_cache(maxsize=1)
+def get_pwd_context():
+    # passlib/bcrypt are only needed once someone signs up or logs in
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 class UserBase(BaseModel):
@@ -44,11 +48,11 @@ class UserOut(UserBase):
 
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 
 @auth_router.post("/signup", response_model=UserOut)
@@ -122,12 +126,17 @@ async def login(request: Request, user: UserLogin):
 def read_users_me(request: Request, current_user: dict = Depends(get_current_user)):
     """
     Get current user info with fresh data from database
+
+    quizAttempts includes this worker's unflushed increments; increments
+    buffered by other workers appear within COUNTER_FLUSH_SECONDS.
     """
     db = request.app.database
     users_collection = db["users"]
 
-    # Fetch fresh user data from database to get updated quizAttempts
-    db_user = users_collection.find_one({"email": current_user["email"]})
+    # Fetch fresh user data and add attempts not yet flushed from the counter buffer
+    db_user, pending = request.app.counters.read(
+        current_user["id"], lambda: users_collection.find_one({"email": current_user["email"]})
+    )
 
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -140,13 +149,15 @@ def read_users_me(request: Request, current_user: dict = Depends(get_current_use
         "department": db_user["department"],
         "rollNo": db_user.get("rollNo"),
         "age": db_user.get("age"),
-        "quizAttempts": db_user.get("quizAttempts", 0),
+        "quizAttempts": db_user.get("quizAttempts", 0) + pending.get("quizAttempts", 0),
     }
 
     return {"user": user_data}
 
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
+    import jwt
+
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=30))
     to_encode.update({"exp": expire})
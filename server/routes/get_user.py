@@ -1,44 +1,65 @@
-from fastapi import Depends, HTTPException, Request, status
-from jose import JWTError, jwt
-import os
-from fastapi.security import OAuth2PasswordBearer
-from dotenv import load_dotenv
+from datetime import datetime, timedelta
+from typing import Optional
 
-load_dotenv()
+from fastapi import Depends, HTTPException, Query, Request, status
+from fastapi.security import OAuth2PasswordBearer
+from settings import settings
+from tracing import span
 
-SECRET_KEY = os.getenv("JWT_SECRET")
-ALGORITHM = "HS256"
+SECRET_KEY = settings.jwt_secret
+ALGORITHM = settings.jwt_algorithm
+FEED_TOKEN_SECONDS = settings.feed_token_seconds
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+# "scope" claim of the short-lived tokens accepted only by the submission feed
+FEED_SCOPE = "submission_feed"
+
+
+def _decode_user(token: str, scope: Optional[str] = None) -> dict:
+    # Imported on first request rather than at startup
+    from jose import JWTError, jwt
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        role = payload.get("role")
-        user_id = payload.get("id")
-        name = payload.get("name")
-        email: str = payload.get("email")
-        rollNo: str = payload.get("rollNo")
-        department: str = payload.get("department")
-        age: int = payload.get("age")
-        if email is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return {
-            "id": user_id,
-            "name": name,
-            "email": email,
-            "role": role,
-            "rollNo": rollNo,
-            "department": department,
-            "age": age,
-        }
+        with span("auth.decode_jwt"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    email: str = payload.get("email")
+    # Feed tokens travel in URLs, so they are never accepted as session tokens
+    if email is None or payload.get("scope") != scope:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {
+        "id": payload.get("id"),
+        "name": payload.get("name"),
+        "email": email,
+        "role": payload.get("role"),
+        "rollNo": payload.get("rollNo"),
+        "department": payload.get("department"),
+        "age": payload.get("age"),
+    }
+
+
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    return _decode_user(token)
+
+
+def create_feed_token(user: dict) -> str:
+    """Short-lived token for the submission feed, which EventSource can only pass in the URL"""
+    from jose import jwt
+
+    claims = {key: user.get(key) for key in ("id", "name", "email", "role", "department")}
+    claims["scope"] = FEED_SCOPE
+    claims["exp"] = datetime.utcnow() + timedelta(seconds=FEED_TOKEN_SECONDS)
+    return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def get_feed_user(token: str = Query(..., description="Token from POST /quiz/submissions/stream-token")):
+    return _decode_user(token, scope=FEED_SCOPE)
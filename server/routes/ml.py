@@ -0,0 +1,193 @@
+import asyncio
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request
+from serialization import FastJSONResponse
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from bson import ObjectId
+from routes.get_user import get_current_user
+from prompt_builder import prompt_stats
+
+ml_router = APIRouter(prefix="/ml", tags=["ML"])
+
+
+class CounterfactualRequest(BaseModel):
+    submissionId: Optional[str] = None
+    features: Optional[Dict[str, float]] = None  # mlAnalytics-style values, instead of a submission
+    targetRisk: Optional[int] = None  # 0=Low, 1=Medium, 2=High; defaults to one level lower
+    maxChanges: int = Field(2, ge=1, le=3)
+    steps: int = Field(10, ge=1, le=50)
+    limit: int = Field(5, ge=1, le=50)
+    vary: Optional[List[str]] = None  # restrict the search to these features
+
+
+@ml_router.get("/drift")
+async def get_drift_report(
+    request: Request, current_user: dict = Depends(get_current_user)
+):
+    """
+    Latest feature-drift and prediction-drift statistics (PSI / KS vs. training reference)
+
+    The statistics cover only the predictions scored by the worker process
+    answering this request ("scope": "worker"); status is "unavailable" when
+    no DRIFT_REFERENCE_PATH is configured.
+    """
+    if current_user.get("role") != "teacher":
+        raise HTTPException(status_code=403, detail="Access denied. Teachers only.")
+
+    from drift_monitor import get_drift_monitor
+
+    return FastJSONResponse(
+        content={
+            "success": True,
+            "drift": {**get_drift_monitor().last_report, "scope": "worker", "pid": os.getpid()},
+        },
+        status_code=200,
+    )
+
+
+@ml_router.get("/global-explanations")
+async def get_global_explanations(
+    request: Request,
+    department: Optional[str] = None,
+    days: Optional[int] = None,
+    buckets: bool = False,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Cohort-level feature importance (mean |SHAP| and mean signed SHAP) per department
+
+    Defaults to the teacher's own department; ``department=all`` covers every
+    department and ``days`` limits the window to recent buckets.
+    """
+    try:
+        if current_user.get("role") != "teacher":
+            raise HTTPException(status_code=403, detail="Access denied. Teachers only.")
+
+        import global_explanations
+
+        if department is None:
+            department = current_user.get("department")
+        if department == "all":
+            department = None
+        since = datetime.utcnow() - timedelta(days=days) if days else None
+
+        explanations = global_explanations.get_global_explanations(
+            request.app.database, department, since=since, include_buckets=buckets
+        )
+
+        return FastJSONResponse(
+            content={"success": True, "explanations": explanations}, status_code=200
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to fetch global explanations: {str(e)}"
+        )
+
+
+@ml_router.get("/shadow")
+async def get_shadow_comparison(
+    request: Request,
+    candidate: Optional[str] = None,
+    days: Optional[int] = None,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Live model vs. shadow candidate: agreement rate, class confusion and inference latency
+
+    Covers every candidate version seen (or only ``candidate``), optionally
+    limited to the last ``days``; ``worker`` shows this process's queue state.
+    """
+    try:
+        if current_user.get("role") != "teacher":
+            raise HTTPException(status_code=403, detail="Access denied. Teachers only.")
+
+        import shadow
+
+        since = datetime.utcnow() - timedelta(days=days) if days else None
+        comparison = shadow.get_comparison(request.app.database, candidate, since=since)
+        worker = request.app.shadow.snapshot() if request.app.shadow is not None else None
+
+        return FastJSONResponse(
+            content={"success": True, "enabled": worker is not None, "worker": worker, "candidates": comparison},
+            status_code=200,
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to fetch shadow comparison: {str(e)}"
+        )
+
+
+@ml_router.get("/prompt-stats")
+async def get_prompt_stats(current_user: dict = Depends(get_current_user)):
+    """
+    Size statistics (characters, estimated tokens) of LLM analysis prompts built by this worker
+    """
+    if current_user.get("role") != "teacher":
+        raise HTTPException(status_code=403, detail="Access denied. Teachers only.")
+
+    return FastJSONResponse(
+        content={"success": True, "prompts": prompt_stats.snapshot()},
+        status_code=200,
+    )
+
+
+@ml_router.post("/counterfactuals")
+async def get_counterfactuals(
+    request: Request,
+    cf_request: CounterfactualRequest,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    What-if analysis: smallest feature changes that lower a student's predicted risk
+    """
+    try:
+        if current_user.get("role") != "teacher":
+            raise HTTPException(status_code=403, detail="Access denied. Teachers only.")
+
+        from counterfactuals import find_counterfactuals
+        from ml_service import FEATURE_NAMES, extract_features
+
+        if cf_request.submissionId:
+            submission = request.app.database["quiz_submissions"].find_one(
+                {"_id": ObjectId(cf_request.submissionId)}, {"mlAnalytics": 1}
+            )
+            if not submission:
+                raise HTTPException(status_code=404, detail="Submission not found")
+        elif cf_request.features is not None:
+            submission = {"mlAnalytics": cf_request.features}
+        else:
+            raise HTTPException(status_code=400, detail="Provide submissionId or features")
+
+        if cf_request.targetRisk is not None and cf_request.targetRisk not in (0, 1, 2):
+            raise HTTPException(status_code=400, detail="targetRisk must be 0, 1 or 2")
+
+        features = extract_features(submission)
+        # The grid search is CPU-bound; keep it off the event loop
+        result = await asyncio.to_thread(
+            find_counterfactuals,
+            [features[name] for name in FEATURE_NAMES],
+            target_risk=cf_request.targetRisk,
+            max_changes=cf_request.maxChanges,
+            steps=cf_request.steps,
+            limit=cf_request.limit,
+            features=cf_request.vary,
+        )
+
+        return FastJSONResponse(
+            content={"success": True, "features": features, **result}, status_code=200
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to compute counterfactuals: {str(e)}"
+        )
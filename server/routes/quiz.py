@@ -1,41 +1,49 @@
+import asyncio
+import logging
+import math
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import List, Optional
-import json
-import re
-import requests
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from serialization import FastJSONResponse, dumps
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from typing import Annotated, Any, List, Optional
 from bson import ObjectId
-from routes.get_user import get_current_user
-from ml_service import predict_student_risk, format_ml_insights_for_gemini
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
-
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-print("Gemini API Key:", GEMINI_API_KEY)
+from routes.get_user import FEED_TOKEN_SECONDS, create_feed_token, get_current_user, get_feed_user
+from llm_client import LLMError, LLMUnavailableError, call_gemini
+from prompt_builder import build_recommendation_prompt, build_batch_recommendation_prompt
+from settings import settings
+from json_extract import JSONExtractError, extract_json
+import etags
+import global_explanations
+import idempotency
+from quiz_cache import CompiledQuiz, quiz_cache
+from admission import llm_admission
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_KEY = settings.gemini_api_key
+
+# Submissions packed into one Gemini prompt by teacher-submit-bulk
+LLM_BATCH_SIZE = settings.llm_batch_size
+
+# Submission fields read by the recommendation prompt
+SUBMISSION_PROMPT_PROJECTION = {
+    "score": 1,
+    "correctAnswers": 1,
+    "totalQuestions": 1,
+    "skillPerformance": 1,
+    "teacherComments": 1,
+    "mlPrediction": 1,
+}
+
+DEFAULT_ANALYSIS = {
+    "recommendations": ["Practice regularly", "Focus on weaker areas"],
+    "explanation": "Continue practicing to improve your skills.",
+}
 
 quiz_router = APIRouter(prefix="/quiz", tags=["Quiz"])
 
 
-def call_gemini(prompt: str):
-    url = f"https://generativelanguage.googleapis.com/v1/models/gemini-2.5-flash:generateContent?key={GEMINI_API_KEY}"
-
-    headers = {"Content-Type": "application/json"}
-
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
-
-    response = requests.post(url, headers=headers, json=payload)
-
-    if response.status_code != 200:
-        raise Exception(f"Gemini API error: {response.text}")
-
-    data = response.json()
-    return data["candidates"][0]["content"]["parts"][0]["text"]
-
-
 class QuizConfig(BaseModel):
     age: int
     grade: str
@@ -50,15 +58,30 @@ class QuizGenerateRequest(BaseModel):
     config: QuizConfig
 
 
-class QuizQuestion(BaseModel):
-    id: int
+class GeneratedQuestion(BaseModel):
+    """A question as returned by Gemini; ids are assigned on our side"""
     question: str
-    skillType: str
-    difficulty: str
+    skillType: str = "Cognitive"
+    difficulty: str = "Easy"
     options: List[str]
     correctAnswer: str
-    timeLimit: int
-    behaviorIndicator: str
+    timeLimit: int = 30
+    behaviorIndicator: str = ""
+
+
+class RecommendationResult(BaseModel):
+    recommendations: List[str]
+    explanation: str
+
+
+class BatchRecommendationResult(RecommendationResult):
+    submissionId: str
+
+
+RECOMMENDATION = TypeAdapter(RecommendationResult)
+GENERATED_QUESTIONS = TypeAdapter(Annotated[List[GeneratedQuestion], Field(min_length=1)])
+# Batch entries are validated one by one so a single bad entry only costs a retry
+BATCH_ENTRIES = TypeAdapter(Annotated[List[Any], Field(min_length=1)])
 
 
 class QuizAnswer(BaseModel):
@@ -70,7 +93,7 @@ class QuizAnswer(BaseModel):
 class QuizSubmitRequest(BaseModel):
     userId: str
     answers: List[QuizAnswer]
-    questions: List[QuizQuestion]
+    quizId: Optional[str] = None  # quiz returned by /quiz/generate; graded server-side
 
 
 class TeacherCommentRequest(BaseModel):
@@ -80,9 +103,103 @@ class TeacherCommentRequest(BaseModel):
 
 class TeacherBulkSubmitRequest(BaseModel):
     submissionIds: List[str]
+    # Submissions per Gemini prompt, 1 = one call each
+    batchSize: Optional[int] = Field(None, ge=1, le=LLM_BATCH_SIZE * 2)
+
+
+def parse_batch_analysis(ai_text: str, submission_ids: List[str]) -> dict:
+    """
+    Parse a batched Gemini response into {submissionId: analysis}
+
+    Entries that are missing, unknown or malformed are left out so the
+    caller can retry just those submissions.
+    """
+    try:
+        entries = extract_json(ai_text, BATCH_ENTRIES, openers="[")
+    except JSONExtractError:
+        return {}
+
+    wanted = set(submission_ids)
+    analyses = {}
+    for entry in entries:
+        try:
+            result = BatchRecommendationResult.model_validate(entry)
+        except ValidationError:
+            continue
+        if result.submissionId in wanted:
+            analyses[result.submissionId] = {
+                "recommendations": result.recommendations,
+                "explanation": result.explanation,
+            }
+    return analyses
+
+
+def analyze_submissions(submissions: List[dict], batch_size: int) -> dict:
+    """
+    Gemini analyses for several submissions, ``batch_size`` per prompt
+
+    Entries that fail to parse or validate are retried once in a batch of
+    their own; anything still missing gets the default advice. Submissions
+    whose Gemini calls raise are left out of the result. Once the breaker is
+    open no further prompts are sent; LLMUnavailableError is raised if
+    nothing was analysed yet.
+    """
+    analyses = {}
+    failed = []
+    for start in range(0, len(submissions), batch_size):
+        batch = submissions[start:start + batch_size]
+        ids = [str(s["_id"]) for s in batch]
+        try:
+            ai_text = call_gemini(build_batch_recommendation_prompt(batch))
+        except LLMUnavailableError:
+            if not analyses:
+                raise
+            return analyses
+        except Exception as e:
+            logger.warning("Batched Gemini call failed for %s: %s", ids, e)
+            failed.extend(batch)
+            continue
+        batch_analyses = parse_batch_analysis(ai_text, ids)
+        analyses.update(batch_analyses)
+        failed.extend(s for s in batch if str(s["_id"]) not in batch_analyses)
+
+    for start in range(0, len(failed), batch_size):
+        batch = failed[start:start + batch_size]
+        ids = [str(s["_id"]) for s in batch]
+        try:
+            ai_text = call_gemini(build_batch_recommendation_prompt(batch))
+        except LLMUnavailableError:
+            if not analyses:
+                raise
+            return analyses
+        except Exception as e:
+            logger.warning("Gemini retry failed for %s: %s", ids, e)
+            continue
+        batch_analyses = parse_batch_analysis(ai_text, ids)
+        for submission_id in ids:
+            analyses[submission_id] = batch_analyses.get(submission_id, DEFAULT_ANALYSIS)
+
+    return analyses
 
 
-@quiz_router.post("/generate")
+def llm_http_error(e: LLMError, action: str) -> HTTPException:
+    """
+    HTTP error for a failed Gemini call
+
+    503 with Retry-After while the breaker is open, 502 for other provider
+    failures. Provider text stays in the log, never in the response.
+    """
+    if isinstance(e, LLMUnavailableError):
+        return HTTPException(
+            status_code=503,
+            detail=f"{action} is temporarily unavailable, please retry shortly",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+        )
+    logger.warning("%s failed: %s", action, e)
+    return HTTPException(status_code=502, detail=f"{action} failed: the AI provider returned an error")
+
+
+@quiz_router.post("/generate", dependencies=[Depends(llm_admission)])
 async def generate_quiz(
     request: Request,
     quiz_request: QuizGenerateRequest,
@@ -93,32 +210,15 @@ async def generate_quiz(
     """
     try:
         # Generate quiz using Gemini API
-        response_text = call_gemini(quiz_request.prompt)
-
-        # Try to find JSON array in the response
-        json_match = re.search(r"\[.*\]", response_text, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(0)
-            questions = json.loads(json_str)
-        else:
-            # If no JSON found, try parsing the entire response
-            questions = json.loads(response_text)
-
-        # Validate and ensure proper structure
-        validated_questions = []
-        for i, q in enumerate(questions):
-            validated_questions.append(
-                {
-                    "id": i + 1,
-                    "question": q.get("question", ""),
-                    "skillType": q.get("skillType", "Cognitive"),
-                    "difficulty": q.get("difficulty", "Easy"),
-                    "options": q.get("options", []),
-                    "correctAnswer": q.get("correctAnswer", ""),
-                    "timeLimit": q.get("timeLimit", 30),
-                    "behaviorIndicator": q.get("behaviorIndicator", ""),
-                }
-            )
+        # Hedged: a duplicate request goes out if the first is slower than recent p95
+        # Off the event loop, so a slow provider doesn't stall other requests
+        response_text = await asyncio.to_thread(call_gemini, quiz_request.prompt, hedge=True)
+
+        # First JSON array in the response that matches the question schema
+        questions = extract_json(response_text, GENERATED_QUESTIONS, openers="[")
+        validated_questions = [
+            {"id": i + 1, **q.model_dump()} for i, q in enumerate(questions)
+        ]
 
         # Store quiz generation in database
         quiz_data = {
@@ -130,8 +230,12 @@ async def generate_quiz(
         }
 
         result = request.app.database["quizzes"].insert_one(quiz_data)
+        # The submission is usually graded by this same worker
+        quiz_cache.put(
+            CompiledQuiz(str(result.inserted_id), current_user["id"], validated_questions)
+        )
 
-        return JSONResponse(
+        return FastJSONResponse(
             content={
                 "success": True,
                 "quizId": str(result.inserted_id),
@@ -140,28 +244,65 @@ async def generate_quiz(
             status_code=200,
         )
 
-    except json.JSONDecodeError as e:
-        raise HTTPException(
-            status_code=500, detail=f"Failed to parse AI response: {str(e)}"
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500, detail=f"Failed to generate quiz: {str(e)}"
-        )
+    except JSONExtractError as e:
+        logger.warning("Unparsable quiz from Gemini: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to parse AI response")
+    except LLMError as e:
+        raise llm_http_error(e, "Quiz generation")
+    except Exception:
+        logger.exception("Quiz generation failed")
+        raise HTTPException(status_code=500, detail="Failed to generate quiz")
 
 
 @quiz_router.post("/submit")
 async def submit_quiz_for_review(
     request: Request,
     quiz_submission: QuizSubmitRequest,
+    background_tasks: BackgroundTasks,
     current_user: dict = Depends(get_current_user),
 ):
     """
     Student submits quiz answers for teacher review (without AI analysis yet)
     """
+    # NumPy-backed ML modules load lazily (and are warmed in the app lifespan)
+    from ml_service import predict_student_risk
+    from features import AnswerBatch, analytics_records
+    from feature_store import get_feature_store, feature_vector_from_analytics
+
+    # A retried submission returns the original result instead of being processed again
+    db = request.app.database
+    idempotency_key = idempotency.submission_key(
+        current_user["id"], quiz_submission, request.headers.get("Idempotency-Key")
+    )
+    # Allocated up front so the claim knows which document this attempt inserts
+    submission_id = ObjectId()
+    previous = idempotency.begin(db, idempotency_key, submission_id)
+    if previous is not None:
+        if previous["status"] == idempotency.STATUS_COMPLETED:
+            return FastJSONResponse(
+                content=previous["response"],
+                status_code=200,
+                headers={"Idempotent-Replayed": "true"},
+            )
+        raise HTTPException(
+            status_code=409, detail="This submission is already being processed"
+        )
+
+    inserted = False
     try:
+        # Grade against the stored quiz, not the client's copy of the answers
+        if not quiz_submission.quizId:
+            raise HTTPException(status_code=400, detail="quizId is required")
+        quiz = quiz_cache.get(db, quiz_submission.quizId)
+        if quiz is None:
+            raise HTTPException(status_code=404, detail="Quiz not found")
+        if quiz.user_id != current_user["id"]:
+            raise HTTPException(status_code=403, detail="Quiz belongs to another user")
+
+        graded = quiz.grade(quiz_submission.answers)
+
         # Calculate score and analyze performance
-        total_questions = len(quiz_submission.questions)
+        total_questions = len(quiz)
         correct_answers = 0
         skill_performance = {
             "Cognitive": {"correct": 0, "total": 0},
@@ -169,39 +310,14 @@ async def submit_quiz_for_review(
             "Behavioural": {"correct": 0, "total": 0},
         }
 
-        detailed_results = []
-
-        for answer in quiz_submission.answers:
-            question = next(
-                (q for q in quiz_submission.questions if q.id == answer.questionId),
-                None,
-            )
+        for i, is_correct in zip(graded.question_index, graded.correct):
+            skill_type = quiz.skill_types[i]
 
-            if question:
-                is_correct = answer.answer == question.correctAnswer
-                
-                # Normalize skill type to handle both British and American spelling
-                skill_type = question.skillType
-                if skill_type == "Behavioral":
-                    skill_type = "Behavioural"
+            if is_correct:
+                correct_answers += 1
+                skill_performance[skill_type]["correct"] += 1
 
-                if is_correct:
-                    correct_answers += 1
-                    skill_performance[skill_type]["correct"] += 1
-
-                skill_performance[skill_type]["total"] += 1
-
-                detailed_results.append(
-                    {
-                        "questionId": question.id,
-                        "question": question.question,
-                        "skillType": skill_type,
-                        "userAnswer": answer.answer,
-                        "correctAnswer": question.correctAnswer,
-                        "isCorrect": is_correct,
-                        "timeSpent": answer.timeSpent,
-                    }
-                )
+            skill_performance[skill_type]["total"] += 1
 
         score_percentage = round((correct_answers / total_questions) * 100, 2)
 
@@ -217,102 +333,18 @@ async def submit_quiz_for_review(
                 elif skill_percentage < 50:
                     weaknesses.append(skill)
 
-        # Calculate ML analytics metrics
-        # 1. Overall accuracy
-        overall_accuracy = round(correct_answers / total_questions, 3)
-        
-        # 2. Skill-specific accuracy
-        cognitive_accuracy = 0.0
-        emotional_accuracy = 0.0
-        behavioural_accuracy = 0.0
-        
-        if skill_performance["Cognitive"]["total"] > 0:
-            cognitive_accuracy = round(
-                skill_performance["Cognitive"]["correct"] / skill_performance["Cognitive"]["total"], 
-                2
-            )
-        if skill_performance["Emotional"]["total"] > 0:
-            emotional_accuracy = round(
-                skill_performance["Emotional"]["correct"] / skill_performance["Emotional"]["total"], 
-                2
-            )
-        if skill_performance["Behavioural"]["total"] > 0:
-            behavioural_accuracy = round(
-                skill_performance["Behavioural"]["correct"] / skill_performance["Behavioural"]["total"], 
-                2
-            )
-        
-        # 3. Average time spent per question
-        total_time = sum(answer.timeSpent for answer in quiz_submission.answers)
-        avg_time_spent = round(total_time / total_questions, 1) if total_questions > 0 else 0
-        
-        # 4. Negative coping responses (emotional regulation indicators)
-        negative_coping_keywords = [
-            "yell", "scream", "shout", "angry", "furious", "rage", "tantrum",
-            "give up", "quit", "ignore", "avoid", "worry", "panic", "afraid",
-            "anxious", "nervous", "scared", "cry", "upset", "frustrated"
-        ]
-        
-        negative_coping_responses = 0
-        positive_coping_responses = 0
-        
-        for answer in quiz_submission.answers:
-            question = next(
-                (q for q in quiz_submission.questions if q.id == answer.questionId),
-                None,
-            )
-            
-            if question and question.skillType in ["Emotional", "Behavioural"]:
-                user_answer_lower = answer.answer.lower()
-                
-                # Check if answer contains negative coping keywords
-                if any(keyword in user_answer_lower for keyword in negative_coping_keywords):
-                    negative_coping_responses += 1
-                elif answer.answer != question.correctAnswer:
-                    # Wrong answer on emotional/behavioral question
-                    negative_coping_responses += 1
-                else:
-                    # Correct answer on emotional/behavioral question
-                    positive_coping_responses += 1
-        
-        # Emotional regulation score
-        total_emotional_behavioral = skill_performance["Emotional"]["total"] + skill_performance["Behavioural"]["total"]
-        emotional_regulation_score = 0.0
-        if total_emotional_behavioral > 0:
-            emotional_regulation_score = round(
-                positive_coping_responses / total_emotional_behavioral, 
-                2
-            )
-        
-        # 5. Attention variance (time spent consistency)
-        if len(quiz_submission.answers) > 1:
-            times = [answer.timeSpent for answer in quiz_submission.answers]
-            mean_time = sum(times) / len(times)
-            variance = sum((t - mean_time) ** 2 for t in times) / len(times)
-            attention_variance = round(variance ** 0.5 / mean_time, 2) if mean_time > 0 else 0
-        else:
-            attention_variance = 0.0
-        
-        # ML Training Analytics
-        ml_analytics = {
-            "overall_accuracy": overall_accuracy,
-            "cognitive_accuracy": cognitive_accuracy,
-            "emotional_accuracy": emotional_accuracy,
-            "behavioural_accuracy": behavioural_accuracy,
-            "avg_time_spent": avg_time_spent,
-            "negative_coping_responses": negative_coping_responses,
-            "positive_coping_responses": positive_coping_responses,
-            "emotional_regulation_score": emotional_regulation_score,
-            "attention_variance": attention_variance,
-            "total_questions": total_questions,
-            "total_time_spent": total_time
-        }
+        # ML Training Analytics (vectorized feature registry, see features.py)
+        batch = AnswerBatch()
+        batch.add_graded(quiz, graded)
+        ml_analytics = analytics_records(batch)[0]
 
         # Store submission in database as PENDING review
         submission_data = {
+            "_id": submission_id,
             "userId": current_user["id"],
             "userName": current_user.get("name", "Unknown"),
             "userEmail": current_user.get("email", ""),
+            "department": current_user.get("department"),
             "submittedAt": datetime.utcnow(),
             "score": score_percentage,
             "correctAnswers": correct_answers,
@@ -320,7 +352,8 @@ async def submit_quiz_for_review(
             "skillPerformance": skill_performance,
             "strengths": strengths,
             "weaknesses": weaknesses,
-            "detailedResults": detailed_results,
+            "quizId": quiz.quiz_id,
+            "responses": graded.to_document(),  # compact per-answer arrays, see quiz_cache
             "status": "pending_review",  # pending_review, reviewed, completed
             "teacherComments": "",
             "recommendations": [],
@@ -332,49 +365,94 @@ async def submit_quiz_for_review(
         try:
             ml_prediction = predict_student_risk(submission_data)
             submission_data["mlPrediction"] = ml_prediction
-            print(f"ML Prediction generated: {ml_prediction['risk_label']} with confidence {ml_prediction['confidence']:.2f}")
+            logger.debug(
+                "ML Prediction generated: %s with confidence %.2f",
+                ml_prediction["risk_label"],
+                ml_prediction["confidence"],
+            )
         except Exception as e:
-            print(f"ML prediction failed: {str(e)}")
+            logger.warning("ML prediction failed: %s", e)
             # Continue without ML prediction - teacher can still review manually
             submission_data["mlPrediction"] = None
 
         result = request.app.database["quiz_submissions"].insert_one(submission_data)
+        inserted = True
+        try:
+            etags.bump(db, etags.ALL_SUBMISSIONS_SCOPE, etags.user_scope(current_user["id"]))
+        except Exception as e:
+            logger.warning("Listing ETag bump failed: %s", e)
 
-        # Increment user's quiz attempts counter (convert string ID to ObjectId)
-        from bson import ObjectId as BsonObjectId
+        # Fold the SHAP values into the department's global explanation bucket
+        if submission_data["mlPrediction"] is not None:
+            try:
+                global_explanations.record(
+                    db,
+                    submission_data["department"],
+                    submission_data["submittedAt"],
+                    submission_data["mlPrediction"],
+                )
+            except Exception as e:
+                logger.warning("Global explanation update failed: %s", e)
+
+            # Compare with the candidate model once the response has gone out
+            if request.app.shadow is not None:
+                background_tasks.add_task(
+                    request.app.shadow.submit,
+                    ml_analytics,
+                    submission_data["mlPrediction"],
+                    submission_data["submittedAt"],
+                )
+
+        # Mirror the feature vector into the columnar feature store for analytics
         try:
-            user_obj_id = BsonObjectId(current_user["id"])
-        except:
-            user_obj_id = current_user["id"]  # If already ObjectId or other format
-        
-        request.app.database["users"].update_one(
-            {"_id": user_obj_id}, {"$inc": {"quizAttempts": 1}}
-        )
+            get_feature_store().append(
+                feature_vector_from_analytics(ml_analytics),
+                submission_data["submittedAt"],
+                current_user["id"],
+            )
+        except Exception as e:
+            logger.warning("Feature store append failed: %s", e)
 
-        return JSONResponse(
-            content={
-                "success": True,
-                "submissionId": str(result.inserted_id),
-                "score": score_percentage,
-                "correctAnswers": correct_answers,
-                "totalQuestions": total_questions,
-                "skillPerformance": skill_performance,
-                "strengths": strengths,
-                "weaknesses": weaknesses,
-                "status": "pending_review",
-                "message": "Quiz submitted for teacher review",
-            },
-            status_code=200,
-        )
+        # Count the attempt; buffered and written in the next counter flush
+        request.app.counters.increment(current_user["id"], "quizAttempts")
+
+        response_content = {
+            "success": True,
+            "submissionId": str(result.inserted_id),
+            "score": score_percentage,
+            "correctAnswers": correct_answers,
+            "totalQuestions": total_questions,
+            "skillPerformance": skill_performance,
+            "strengths": strengths,
+            "weaknesses": weaknesses,
+            "status": "pending_review",
+            "message": "Quiz submitted for teacher review",
+        }
+        idempotency.complete(db, idempotency_key, response_content)
+
+        return FastJSONResponse(content=response_content, status_code=200)
 
+    except HTTPException:
+        idempotency.release(db, idempotency_key)
+        raise
     except Exception as e:
-        print("Error:", str(e))
+        logger.exception("Quiz submission failed")
+        if inserted:
+            # The submission is stored: replay it to retries rather than inserting it again
+            try:
+                idempotency.complete(db, idempotency_key, idempotency.submission_response(submission_data))
+            except Exception:
+                logger.exception("Completing idempotency claim failed")
+        else:
+            idempotency.release(db, idempotency_key)
         raise HTTPException(status_code=500, detail=f"Failed to submit quiz: {str(e)}")
 
 
 @quiz_router.get("/all-submissions")
 async def get_all_submissions(
-    request: Request, current_user: dict = Depends(get_current_user)
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None),
 ):
     """
     Get all quiz submissions (for teachers)
@@ -384,22 +462,19 @@ async def get_all_submissions(
         if current_user.get("role") != "teacher":
             raise HTTPException(status_code=403, detail="Access denied. Teachers only.")
 
+        # Answer unchanged polls from the validators alone
+        etag = etags.listing_etag(request.app.database, etags.ALL_SUBMISSIONS_SCOPE, {})
+        if etags.matches(if_none_match, etag):
+            return etags.not_modified(etag)
+
         submissions = list(
             request.app.database["quiz_submissions"].find({}).sort("submittedAt", -1)
         )
 
-        # Convert ObjectId to string and datetime fields to ISO format
-        for submission in submissions:
-            submission["_id"] = str(submission["_id"])
-            if "submittedAt" in submission and submission["submittedAt"]:
-                submission["submittedAt"] = submission["submittedAt"].isoformat()
-            if "reviewedAt" in submission and submission["reviewedAt"]:
-                submission["reviewedAt"] = submission["reviewedAt"].isoformat()
-            if "completedAt" in submission and submission["completedAt"]:
-                submission["completedAt"] = submission["completedAt"].isoformat()
-
-        return JSONResponse(
-            content={"success": True, "submissions": submissions}, status_code=200
+        return FastJSONResponse(
+            content={"success": True, "submissions": submissions},
+            status_code=200,
+            headers=etags.validator_headers(etag),
         )
 
     except HTTPException:
@@ -410,6 +485,73 @@ async def get_all_submissions(
         )
 
 
+def _require_feed_teacher(current_user: dict):
+    if current_user.get("role") != "teacher":
+        raise HTTPException(status_code=403, detail="Access denied. Teachers only.")
+    # Without a department the feed filter would match every department
+    if not current_user.get("department"):
+        raise HTTPException(status_code=403, detail="Access denied. No department assigned.")
+
+
+@quiz_router.post("/submissions/stream-token")
+async def create_stream_token(current_user: dict = Depends(get_current_user)):
+    """
+    Short-lived token for /submissions/stream
+
+    EventSource cannot send an Authorization header, so the feed takes this
+    token as a query parameter instead of the session token.
+    """
+    _require_feed_teacher(current_user)
+    return FastJSONResponse(
+        content={"token": create_feed_token(current_user), "expiresIn": FEED_TOKEN_SECONDS}
+    )
+
+
+@quiz_router.get("/submissions/stream")
+async def stream_submissions(
+    request: Request,
+    status: Optional[str] = None,
+    last_event_id: Optional[str] = Header(default=None),
+    resume: Optional[str] = Query(default=None, alias="lastEventId"),
+    current_user: dict = Depends(get_feed_user),
+):
+    """
+    Live feed of new and updated submissions in the teacher's department (Server-Sent Events)
+
+    Authenticated with ?token= from POST /submissions/stream-token. The browser's
+    own reconnects send Last-Event-ID; a client reopening the stream with a fresh
+    token passes the last event id as ?lastEventId= to resume from the change
+    stream token.
+    """
+    _require_feed_teacher(current_user)
+
+    from submission_feed import stream_submission_events, supports_change_streams
+
+    try:
+        replicated = await supports_change_streams(request.app.async_database)
+    except Exception as e:
+        logger.warning("Change stream precheck failed: %s", e)
+        replicated = False
+    if not replicated:
+        raise HTTPException(
+            status_code=503, detail="Live feed unavailable: MongoDB is not a replica set"
+        )
+
+    events = stream_submission_events(
+        request.app.async_database["quiz_submissions"],
+        department=current_user["department"],
+        status=status,
+        resume_token=last_event_id or resume,
+        is_disconnected=request.is_disconnected,
+        encode=lambda event: dumps(event).decode("utf-8"),
+    )
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @quiz_router.post("/teacher-comment")
 async def add_teacher_comment(
     request: Request,
@@ -425,7 +567,7 @@ async def add_teacher_comment(
             raise HTTPException(status_code=403, detail="Access denied. Teachers only.")
 
         # Update the submission with teacher comments
-        result = request.app.database["quiz_submissions"].update_one(
+        updated = request.app.database["quiz_submissions"].find_one_and_update(
             {"_id": ObjectId(comment_request.submissionId)},
             {
                 "$set": {
@@ -435,12 +577,19 @@ async def add_teacher_comment(
                     "status": "reviewed",
                 }
             },
+            projection={"userId": 1},
         )
 
-        if result.matched_count == 0:
+        if updated is None:
             raise HTTPException(status_code=404, detail="Submission not found")
 
-        return JSONResponse(
+        etags.bump(
+            request.app.database,
+            etags.ALL_SUBMISSIONS_SCOPE,
+            etags.user_scope(updated.get("userId")),
+        )
+
+        return FastJSONResponse(
             content={"success": True, "message": "Comment added successfully"},
             status_code=200,
         )
@@ -451,7 +600,7 @@ async def add_teacher_comment(
         raise HTTPException(status_code=500, detail=f"Failed to add comment: {str(e)}")
 
 
-@quiz_router.post("/teacher-submit/{submission_id}")
+@quiz_router.post("/teacher-submit/{submission_id}", dependencies=[Depends(llm_admission)])
 async def teacher_submit_single(
     request: Request,
     submission_id: str,
@@ -474,60 +623,15 @@ async def teacher_submit_single(
             raise HTTPException(status_code=404, detail="Submission not found")
 
         # Generate AI recommendations with ML insights
-        score_percentage = submission["score"]
-        correct_answers = submission["correctAnswers"]
-        total_questions = submission["totalQuestions"]
-        skill_performance = submission["skillPerformance"]
-        
-        # Build recommendation prompt with ML insights if available
-        ml_insights_text = ""
-        if submission.get("mlPrediction"):
-            ml_insights_text = format_ml_insights_for_gemini(submission["mlPrediction"])
-        
-        recommendation_prompt = f"""
-        Based on the following quiz results, provide personalized learning recommendations:
-        
-        Score: {score_percentage}%
-        Correct Answers: {correct_answers}/{total_questions}
-        
-        Skill Performance:
-        - Cognitive: {skill_performance['Cognitive']['correct']}/{skill_performance['Cognitive']['total']}
-        - Emotional: {skill_performance['Emotional']['correct']}/{skill_performance['Emotional']['total']}
-        - Behavioural: {skill_performance['Behavioural']['correct']}/{skill_performance['Behavioural']['total']}
-        
-        Teacher Comments: {submission.get('teacherComments', 'None')}
-        
-        {ml_insights_text}
-        
-        Provide:
-        1. 3-5 specific, actionable recommendations for improvement that incorporate the ML insights
-        2. A brief explanation of the student's performance pattern considering the risk assessment and feature importance
-        3. Address the key factors identified by SHAP and LIME explanations
-        
-        Format as JSON:
-        {{
-            "recommendations": ["recommendation1", "recommendation2", ...],
-            "explanation": "explanation text"
-        }}
-        """
-
-        ai_text = call_gemini(recommendation_prompt)
+        recommendation_prompt = build_recommendation_prompt(submission)
+
+        ai_text = await asyncio.to_thread(call_gemini, recommendation_prompt)
 
         # Parse AI recommendations
         try:
-            json_match = re.search(r"\{.*\}", ai_text, re.DOTALL)
-            if json_match:
-                ai_analysis = json.loads(json_match.group(0))
-            else:
-                ai_analysis = {
-                    "recommendations": ["Practice regularly", "Focus on weaker areas"],
-                    "explanation": "Continue practicing to improve your skills.",
-                }
-        except:
-            ai_analysis = {
-                "recommendations": ["Practice regularly", "Focus on weaker areas"],
-                "explanation": "Continue practicing to improve your skills.",
-            }
+            ai_analysis = extract_json(ai_text, RECOMMENDATION, openers="{").model_dump()
+        except JSONExtractError:
+            ai_analysis = DEFAULT_ANALYSIS
 
         # Update submission with AI analysis and mark as completed
         request.app.database["quiz_submissions"].update_one(
@@ -542,8 +646,13 @@ async def teacher_submit_single(
                 }
             },
         )
+        etags.bump(
+            request.app.database,
+            etags.ALL_SUBMISSIONS_SCOPE,
+            etags.user_scope(submission.get("userId")),
+        )
 
-        return JSONResponse(
+        return FastJSONResponse(
             content={
                 "success": True,
                 "message": "Quiz submitted successfully with AI recommendations",
@@ -555,11 +664,14 @@ async def teacher_submit_single(
 
     except HTTPException:
         raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to submit quiz: {str(e)}")
+    except LLMError as e:
+        raise llm_http_error(e, "AI analysis")
+    except Exception:
+        logger.exception("Teacher submit failed for %s", submission_id)
+        raise HTTPException(status_code=500, detail="Failed to submit quiz")
 
 
-@quiz_router.post("/teacher-submit-bulk")
+@quiz_router.post("/teacher-submit-bulk", dependencies=[Depends(llm_admission)])
 async def teacher_submit_bulk(
     request: Request,
     bulk_request: TeacherBulkSubmitRequest,
@@ -568,151 +680,144 @@ async def teacher_submit_bulk(
     """
     Teacher submits multiple quizzes for AI analysis and final processing
     """
-    print("Bulk submission request received for IDs:", bulk_request)
-    print("Submission IDs:", bulk_request.submissionIds)
+    logger.debug("Bulk submission request for %d submissions", len(bulk_request.submissionIds))
     try:
         # Check if user is a teacher
         if current_user.get("role") != "teacher":
             raise HTTPException(status_code=403, detail="Access denied. Teachers only.")
 
-        processed_count = 0
-        failed_count = 0
+        from pymongo import UpdateOne
+        from pymongo.errors import BulkWriteError
+
+        collection = request.app.database["quiz_submissions"]
 
-        for submission_id in bulk_request.submissionIds:
+        # Per-id outcome in request order, keyed by the normalised id so that
+        # spellings of the same ObjectId are looked up and analysed once
+        results = {}
+        object_ids = []
+        for raw_id in bulk_request.submissionIds:
             try:
-                # Get the submission
-                submission = request.app.database["quiz_submissions"].find_one(
-                    {"_id": ObjectId(submission_id)}
-                )
+                object_id = ObjectId(raw_id)
+            except Exception:
+                results.setdefault(raw_id, "Invalid submission id")
+                continue
+            submission_id = str(object_id)
+            if submission_id not in results:
+                results[submission_id] = "Submission not found"
+                object_ids.append(object_id)
 
-                if not submission:
-                    failed_count += 1
-                    continue
-
-                # Generate AI recommendations with ML insights
-                score_percentage = submission["score"]
-                correct_answers = submission["correctAnswers"]
-                total_questions = submission["totalQuestions"]
-                skill_performance = submission["skillPerformance"]
-                
-                # Build recommendation prompt with ML insights if available
-                ml_insights_text = ""
-                if submission.get("mlPrediction"):
-                    ml_insights_text = format_ml_insights_for_gemini(submission["mlPrediction"])
-
-                recommendation_prompt = f"""
-                Based on the following quiz results, provide personalized learning recommendations:
-                
-                Score: {score_percentage}%
-                Correct Answers: {correct_answers}/{total_questions}
-                
-                Skill Performance:
-                - Cognitive: {skill_performance['Cognitive']['correct']}/{skill_performance['Cognitive']['total']}
-                - Emotional: {skill_performance['Emotional']['correct']}/{skill_performance['Emotional']['total']}
-                - Behavioural: {skill_performance['Behavioural']['correct']}/{skill_performance['Behavioural']['total']}
-                
-                Teacher Comments: {submission.get('teacherComments', 'None')}
-                
-                {ml_insights_text}
-                
-                Provide:
-                1. 3-5 specific, actionable recommendations for improvement that incorporate the ML insights
-                2. A brief explanation of the student's performance pattern
-                
-                Format as JSON:
-                {{
-                    "recommendations": ["recommendation1", "recommendation2", ...],
-                    "explanation": "explanation text"
-                }}
-                """
-
-                ai_text = call_gemini(recommendation_prompt)
-
-                # Parse AI recommendations
-                try:
-                    json_match = re.search(r"\{.*\}", ai_text, re.DOTALL)
-                    if json_match:
-                        ai_analysis = json.loads(json_match.group(0))
-                    else:
-                        ai_analysis = {
-                            "recommendations": [
-                                "Practice regularly",
-                                "Focus on weaker areas",
-                            ],
-                            "explanation": "Continue practicing to improve your skills.",
-                        }
-                except:
-                    ai_analysis = {
-                        "recommendations": [
-                            "Practice regularly",
-                            "Focus on weaker areas",
-                        ],
-                        "explanation": "Continue practicing to improve your skills.",
-                    }
-
-                # Update submission
-                request.app.database["quiz_submissions"].update_one(
-                    {"_id": ObjectId(submission_id)},
+        # Get all submissions in one query, with only the fields the prompt uses
+        submissions = list(
+            collection.find(
+                {"_id": {"$in": object_ids}}, {**SUBMISSION_PROMPT_PROJECTION, "userId": 1}
+            )
+        ) if object_ids else []
+        for submission in submissions:
+            results[str(submission["_id"])] = None
+
+        # Generate AI recommendations with ML insights, several submissions per prompt
+        batch_size = max(1, bulk_request.batchSize or LLM_BATCH_SIZE)
+        analyses = await asyncio.to_thread(analyze_submissions, submissions, batch_size)
+
+        operations = []
+        operation_ids = []
+        completed_at = datetime.utcnow()
+        for submission in submissions:
+            submission_id = str(submission["_id"])
+            ai_analysis = analyses.get(submission_id)
+            if ai_analysis is None:
+                results[submission_id] = "AI analysis failed"
+                continue
+            operations.append(
+                UpdateOne(
+                    {"_id": submission["_id"]},
                     {
                         "$set": {
                             "recommendations": ai_analysis.get("recommendations", []),
                             "explanation": ai_analysis.get("explanation", ""),
                             "status": "completed",
-                            "completedAt": datetime.utcnow(),
+                            "completedAt": completed_at,
                             "completedBy": current_user["name"],
                         }
                     },
                 )
+            )
+            operation_ids.append(submission_id)
 
-                processed_count += 1
+        # Apply every update in one unordered round trip
+        write_errors = {}
+        if operations:
+            try:
+                collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    write_errors[operation_ids[error["index"]]] = error.get("errmsg", "Write failed")
+        for submission_id in operation_ids:
+            results[submission_id] = write_errors.get(submission_id, "completed")
+
+        completed_users = [
+            etags.user_scope(submission.get("userId"))
+            for submission in submissions
+            if results[str(submission["_id"])] == "completed"
+        ]
+        if completed_users:
+            etags.bump(request.app.database, etags.ALL_SUBMISSIONS_SCOPE, *completed_users)
 
-            except Exception as e:
-                print(f"Error processing submission {submission_id}: {str(e)}")
-                failed_count += 1
-                continue
+        processed_count = sum(1 for outcome in results.values() if outcome == "completed")
+        failed_count = len(results) - processed_count
 
-        return JSONResponse(
+        return FastJSONResponse(
             content={
                 "success": True,
                 "message": f"Processed {processed_count} submissions successfully",
                 "processed": processed_count,
                 "failed": failed_count,
+                "results": [
+                    {"submissionId": submission_id, "success": outcome == "completed"}
+                    if outcome == "completed"
+                    else {"submissionId": submission_id, "success": False, "error": outcome}
+                    for submission_id, outcome in results.items()
+                ],
             },
             status_code=200,
         )
 
     except HTTPException:
         raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to bulk submit: {str(e)}")
+    except LLMError as e:
+        raise llm_http_error(e, "AI analysis")
+    except Exception:
+        logger.exception("Bulk teacher submit failed")
+        raise HTTPException(status_code=500, detail="Failed to bulk submit")
 
 @quiz_router.get("/history")
 async def get_user_quiz_history(
-    request: Request, current_user: dict = Depends(get_current_user)
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+    if_none_match: Optional[str] = Header(None),
 ):
     """
     Get quiz history for the current user (only completed quizzes)
     """
     try:
+        query = {"userId": current_user["id"]}
+        etag = etags.listing_etag(
+            request.app.database, etags.user_scope(current_user["id"]), query
+        )
+        if etags.matches(if_none_match, etag):
+            return etags.not_modified(etag)
+
         results = list(
             request.app.database["quiz_submissions"]
-            .find({"userId": current_user["id"]})
+            .find(query)
             .sort("submittedAt", -1)
             .limit(10)
         )
 
-        # Convert ObjectId to string and datetime fields to ISO format
-        for result in results:
-            result["_id"] = str(result["_id"])
-            if "submittedAt" in result and result["submittedAt"]:
-                result["submittedAt"] = result["submittedAt"].isoformat()
-            if "reviewedAt" in result and result["reviewedAt"]:
-                result["reviewedAt"] = result["reviewedAt"].isoformat()
-            if "completedAt" in result and result["completedAt"]:
-                result["completedAt"] = result["completedAt"].isoformat()
-
-        return JSONResponse(
-            content={"success": True, "results": results}, status_code=200
+        return FastJSONResponse(
+            content={"success": True, "results": results},
+            status_code=200,
+            headers=etags.validator_headers(etag),
         )
 
     except Exception as e:
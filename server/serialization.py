@@ -0,0 +1,49 @@
+"""
+Fast JSON response serialization
+
+FastJSONResponse encodes route payloads with orjson when it is installed,
+handling ObjectId, datetime and NumPy values natively so routes can return
+Mongo documents as-is instead of converting every field by hand first.
+Falls back to the stdlib encoder with the same conversions.
+"""
+import json
+from datetime import date, datetime
+from typing import Any
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+_ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+
+def _default(obj: Any):
+    """Encode types neither backend handles natively (datetime only for stdlib json)"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    # NumPy scalars and arrays, detected without importing numpy
+    if type(obj).__module__ == "numpy" and hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse that serializes BSON/NumPy values without a pre-pass"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,76 @@
+"""
+Production entry point
+
+Runs the API under gunicorn with N uvicorn worker processes. The app, the
+risk model and the drift reference are loaded once in the master before
+forking (preload_app), so workers share that memory copy-on-write instead
+of each loading its own copy. Per-process resources (the Mongo client, the
+drift schedule) are still created in each worker's lifespan.
+
+Usage:
+    python serve.py
+
+Configured through settings: PORT, WEB_CONCURRENCY (worker processes),
+WORKER_CONNECTIONS (concurrent requests per worker), GRACEFUL_TIMEOUT and
+MAX_REQUESTS. On SIGHUP gunicorn starts fresh workers and drains the old
+ones; on SIGTERM in-flight requests get GRACEFUL_TIMEOUT seconds to finish.
+"""
+from gunicorn.app.base import BaseApplication
+
+from settings import settings
+
+try:
+    from uvicorn_worker import UvicornWorker
+except ImportError:
+    from uvicorn.workers import UvicornWorker
+
+
+class ProductionWorker(UvicornWorker):
+    """Uvicorn worker with a per-process concurrency cap and graceful shutdown window"""
+
+    CONFIG_KWARGS = {
+        **UvicornWorker.CONFIG_KWARGS,
+        # Beyond this many concurrent connections the worker answers 503
+        "limit_concurrency": settings.worker_connections,
+        "timeout_graceful_shutdown": settings.graceful_timeout,
+    }
+
+
+class ProductionServer(BaseApplication):
+    """gunicorn application that preloads shared state before forking workers"""
+
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        # Runs once in the master because preload_app is set
+        from app import app, warm_ml_stack
+
+        warm_ml_stack()
+        return app
+
+
+def gunicorn_options() -> dict:
+    return {
+        "bind": f"0.0.0.0:{settings.port}",
+        "workers": settings.web_concurrency,
+        "worker_class": "serve.ProductionWorker",
+        "preload_app": True,
+        "graceful_timeout": settings.graceful_timeout,
+        "timeout": max(60, settings.graceful_timeout * 2),
+        "keepalive": 5,
+        # Recycle workers periodically (0 disables); jitter avoids synchronised restarts
+        "max_requests": settings.max_requests,
+        "max_requests_jitter": settings.max_requests // 10 if settings.max_requests else 0,
+        "accesslog": "-",
+    }
+
+
+if __name__ == "__main__":
+    ProductionServer(gunicorn_options()).run()
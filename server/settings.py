@@ -0,0 +1,162 @@
+"""
+Application settings
+
+Environment variables (and the .env file) are read exactly once, into a
+typed, immutable Settings object. Modules import ``settings`` from here
+instead of calling load_dotenv()/os.getenv themselves.
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+_SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _env(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    return value.strip()
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(_env(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(_env(name, str(default)))
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    return _env(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class Settings:
+    # Server
+    port: int
+    debug: bool
+    web_concurrency: int
+    worker_connections: int
+    graceful_timeout: int
+    max_requests: int
+    log_level: str
+    log_levels: Optional[str]
+    log_format: str
+    log_debug_sample_every: int
+    trace_exporter: str
+    trace_sample_rate: float
+    trace_file: str
+    trace_otlp_endpoint: str
+
+    # Database
+    mongodb_uri: Optional[str]
+    database_name: Optional[str]
+
+    # Auth
+    jwt_secret: Optional[str]
+    jwt_algorithm: str
+    feed_token_seconds: int
+
+    # LLM
+    gemini_api_key: Optional[str]
+    llm_deadline_seconds: float
+    llm_max_attempts: int
+    llm_retry_budget_ratio: float
+    llm_breaker_failures: int
+    llm_breaker_reset_seconds: float
+    llm_batch_size: int
+    prompt_token_budget: int
+    prompt_top_k: int
+    llm_max_in_flight: int
+    llm_max_queue: int
+    llm_queue_timeout: float
+    admission_user_rate: float
+    admission_user_burst: float
+    admission_department_rate: float
+    admission_department_burst: float
+
+    # ML
+    model_path: Optional[str]
+    model_version: Optional[str]
+    feature_set: str
+    feature_store_dir: str
+    shadow_model_path: Optional[str]
+    shadow_model_version: Optional[str]
+    shadow_feature_set: Optional[str]
+    shadow_workers: int
+    shadow_queue_size: int
+    drift_reference_path: Optional[str]
+    drift_interval_seconds: float
+    drift_decay: float
+    explanation_bucket_seconds: int
+
+    # Submissions
+    idempotency_ttl_seconds: int
+    idempotency_lease_seconds: int
+    quiz_cache_size: int
+    counter_flush_seconds: float
+
+
+def load_settings() -> Settings:
+    """Load .env (without overriding real environment variables) and build Settings"""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return Settings(
+        port=_env_int("PORT", 8000),
+        debug=_env_bool("DEBUG", False),
+        web_concurrency=_env_int("WEB_CONCURRENCY", os.cpu_count() or 1),
+        worker_connections=_env_int("WORKER_CONNECTIONS", 1000),
+        graceful_timeout=_env_int("GRACEFUL_TIMEOUT", 30),
+        max_requests=_env_int("MAX_REQUESTS", 0),
+        log_level=_env("LOG_LEVEL", "INFO"),
+        log_levels=_env("LOG_LEVELS"),
+        log_format=_env("LOG_FORMAT", "json"),
+        log_debug_sample_every=_env_int("LOG_DEBUG_SAMPLE_EVERY", 100),
+        trace_exporter=_env("TRACE_EXPORTER", "none"),
+        trace_sample_rate=_env_float("TRACE_SAMPLE_RATE", 0.1),
+        trace_file=_env("TRACE_FILE", os.path.join(_SERVER_DIR, "data", "traces.jsonl")),
+        trace_otlp_endpoint=_env("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"),
+        mongodb_uri=_env("MONGODB_URI"),
+        database_name=_env("DEV_DATABASE"),
+        jwt_secret=_env("JWT_SECRET"),
+        jwt_algorithm=_env("ALGORITHM", "HS256"),
+        feed_token_seconds=_env_int("FEED_TOKEN_SECONDS", 60),
+        gemini_api_key=_env("GEMINI_API_KEY"),
+        llm_deadline_seconds=_env_float("LLM_DEADLINE_SECONDS", 30.0),
+        llm_max_attempts=_env_int("LLM_MAX_ATTEMPTS", 3),
+        llm_retry_budget_ratio=_env_float("LLM_RETRY_BUDGET_RATIO", 0.2),
+        llm_breaker_failures=_env_int("LLM_BREAKER_FAILURES", 5),
+        llm_breaker_reset_seconds=_env_float("LLM_BREAKER_RESET_SECONDS", 30.0),
+        llm_batch_size=_env_int("LLM_BATCH_SIZE", 5),
+        prompt_token_budget=_env_int("PROMPT_TOKEN_BUDGET", 600),
+        prompt_top_k=_env_int("PROMPT_TOP_K", 3),
+        llm_max_in_flight=_env_int("LLM_MAX_IN_FLIGHT", 16),
+        llm_max_queue=_env_int("LLM_MAX_QUEUE", 64),
+        llm_queue_timeout=_env_float("LLM_QUEUE_TIMEOUT", 5.0),
+        admission_user_rate=_env_float("ADMISSION_USER_RATE", 6.0),
+        admission_user_burst=_env_float("ADMISSION_USER_BURST", 3.0),
+        admission_department_rate=_env_float("ADMISSION_DEPARTMENT_RATE", 120.0),
+        admission_department_burst=_env_float("ADMISSION_DEPARTMENT_BURST", 40.0),
+        model_path=_env("MODEL_PATH"),
+        model_version=_env("MODEL_VERSION"),
+        feature_set=_env("FEATURE_SET", "v1"),
+        feature_store_dir=_env("FEATURE_STORE_DIR", os.path.join(_SERVER_DIR, "data", "feature_store")),
+        shadow_model_path=_env("SHADOW_MODEL_PATH"),
+        shadow_model_version=_env("SHADOW_MODEL_VERSION"),
+        shadow_feature_set=_env("SHADOW_FEATURE_SET"),
+        shadow_workers=_env_int("SHADOW_WORKERS", 1),
+        shadow_queue_size=_env_int("SHADOW_QUEUE_SIZE", 1000),
+        drift_reference_path=_env("DRIFT_REFERENCE_PATH"),
+        drift_interval_seconds=_env_float("DRIFT_INTERVAL_SECONDS", 300.0),
+        drift_decay=_env_float("DRIFT_DECAY", 0.5),
+        explanation_bucket_seconds=_env_int("EXPLANATION_BUCKET_SECONDS", 24 * 3600),
+        idempotency_ttl_seconds=_env_int("IDEMPOTENCY_TTL_SECONDS", 24 * 3600),
+        idempotency_lease_seconds=_env_int("IDEMPOTENCY_LEASE_SECONDS", 60),
+        quiz_cache_size=_env_int("QUIZ_CACHE_SIZE", 1024),
+        counter_flush_seconds=_env_float("COUNTER_FLUSH_SECONDS", 1.0),
+    )
+
+
+settings = load_settings()
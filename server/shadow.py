@@ -0,0 +1,289 @@
+"""
+Shadow scoring of a candidate risk model
+
+When SHADOW_MODEL_PATH is set, every prediction made on /quiz/submit is
+queued (after the response has been sent) for a small pool of background
+threads. They score the same submission with the candidate model, time
+both models on the same row, and fold the comparison into one running-sum
+document per candidate version and hour in ``shadow_comparisons``:
+
+    {
+        "_id": "<candidate version>:<bucket start, ISO>",
+        "candidateVersion": str,
+        "primaryVersion": str,
+        "bucket": datetime,
+        "count": int,
+        "agree": int,                         same predicted class
+        "probL1": float,                      sum of L1 distances between probability vectors
+        "confusion": {"<primary>_<candidate>": int},
+        "latencyMs": {"primary": float, "candidate": float},
+        "latencyHist": {"primary": {"<bin>": int}, "candidate": {...}},
+    }
+
+Updates are upserted $inc, so documents from all workers simply add up.
+The queue is bounded; when it is full a comparison is dropped rather than
+slowing the request down.
+
+Configuration: SHADOW_MODEL_PATH, SHADOW_MODEL_VERSION (defaults to a hash
+of the file), SHADOW_FEATURE_SET (defaults to FEATURE_SET), SHADOW_WORKERS,
+SHADOW_QUEUE_SIZE.
+"""
+import logging
+import math
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from features import FEATURE_SET_VERSION, model_feature_names
+from global_explanations import bucket_start
+from settings import settings
+
+COLLECTION = "shadow_comparisons"
+
+SHADOW_MODEL_PATH = settings.shadow_model_path
+SHADOW_FEATURE_SET = settings.shadow_feature_set or FEATURE_SET_VERSION
+SHADOW_WORKERS = settings.shadow_workers
+SHADOW_QUEUE_SIZE = settings.shadow_queue_size
+
+SHADOW_BUCKET_SECONDS = 3600
+# Comparisons written per bulk_write
+SHADOW_BATCH_SIZE = 100
+
+# Upper bounds (ms) of the latency histogram bins; the last bin is open
+LATENCY_BINS_MS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, math.inf]
+
+PROBABILITY_KEYS = ["low", "medium", "high"]
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_indexes(db):
+    db[COLLECTION].create_index([("candidateVersion", 1), ("bucket", -1)])
+
+
+def latency_bin(ms: float) -> int:
+    for i, upper in enumerate(LATENCY_BINS_MS):
+        if ms <= upper:
+            return i
+    return len(LATENCY_BINS_MS) - 1
+
+
+def get_candidate_version() -> str:
+    from ml_service import model_file_version
+
+    base = settings.shadow_model_version or model_file_version(SHADOW_MODEL_PATH)
+    return f"{base}+{SHADOW_FEATURE_SET}"
+
+
+class ShadowScorer:
+    """Bounded queue plus worker threads comparing the candidate with the live model"""
+
+    def __init__(self, db, workers: int = SHADOW_WORKERS, queue_size: int = SHADOW_QUEUE_SIZE):
+        self.db = db
+        self.feature_names = model_feature_names(SHADOW_FEATURE_SET)
+        self.candidate_version = get_candidate_version()
+        self.submitted = 0
+        self.dropped = 0
+        self.failed = 0
+        self._candidate = None
+        self._model_lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=queue_size)
+        self._threads = [
+            threading.Thread(target=self._run, name=f"shadow-{i}", daemon=True) for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, ml_analytics: Dict[str, Any], ml_prediction: Dict[str, Any], submitted_at: datetime):
+        """Queue one live prediction for comparison; never blocks"""
+        try:
+            self._queue.put_nowait((ml_analytics, ml_prediction, submitted_at))
+            self.submitted += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _get_candidate(self):
+        # Loaded by the first worker that needs it, off the request path
+        with self._model_lock:
+            if self._candidate is None:
+                from ml_service import load_model
+
+                self._candidate = load_model(SHADOW_MODEL_PATH)
+            return self._candidate
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < SHADOW_BATCH_SIZE:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self.compare(batch)
+            except Exception:
+                self.failed += len(batch)
+                logger.exception("Shadow comparison failed")
+            if stop:
+                return
+
+    def compare(self, batch: List[tuple]):
+        """Score ``batch`` with both models and add the results to the hourly documents"""
+        from pymongo import UpdateOne
+
+        from ml_service import FEATURE_NAMES, get_model, get_model_version
+
+        primary = get_model()
+        candidate = self._get_candidate()
+        primary_version = get_model_version()
+
+        increments: Dict[datetime, Dict[str, Any]] = {}
+        for ml_analytics, ml_prediction, submitted_at in batch:
+            primary_row = [[float(ml_analytics.get(name, 0.0)) for name in FEATURE_NAMES]]
+            candidate_row = [[float(ml_analytics.get(name, 0.0)) for name in self.feature_names]]
+
+            # Both models timed on this thread, so the latencies are comparable
+            started = time.perf_counter()
+            primary.predict_proba(primary_row)
+            primary_ms = (time.perf_counter() - started) * 1000.0
+            started = time.perf_counter()
+            probabilities = np.asarray(candidate.predict_proba(candidate_row))[0]
+            candidate_ms = (time.perf_counter() - started) * 1000.0
+
+            primary_class = int(ml_prediction["predicted_risk"])
+            candidate_class = int(np.argmax(probabilities))
+            primary_probabilities = ml_prediction.get("probabilities", {})
+            prob_l1 = sum(
+                abs(float(primary_probabilities.get(key, 0.0)) - float(probabilities[i]))
+                for i, key in enumerate(PROBABILITY_KEYS)
+            )
+
+            inc = increments.setdefault(bucket_start(submitted_at, SHADOW_BUCKET_SECONDS), {})
+            for key, value in (
+                ("count", 1),
+                ("agree", int(primary_class == candidate_class)),
+                ("probL1", prob_l1),
+                (f"confusion.{primary_class}_{candidate_class}", 1),
+                ("latencyMs.primary", primary_ms),
+                ("latencyMs.candidate", candidate_ms),
+                (f"latencyHist.primary.{latency_bin(primary_ms)}", 1),
+                (f"latencyHist.candidate.{latency_bin(candidate_ms)}", 1),
+            ):
+                inc[key] = inc.get(key, 0) + value
+
+        self.db[COLLECTION].bulk_write(
+            [
+                UpdateOne(
+                    {"_id": f"{self.candidate_version}:{bucket.isoformat()}"},
+                    {
+                        "$inc": inc,
+                        "$setOnInsert": {
+                            "candidateVersion": self.candidate_version,
+                            "primaryVersion": primary_version,
+                            "bucket": bucket,
+                        },
+                    },
+                    upsert=True,
+                )
+                for bucket, inc in increments.items()
+            ],
+            ordered=False,
+        )
+
+    def shutdown(self, timeout: float = 5.0):
+        """Let the workers finish what is queued (lifespan shutdown)"""
+        for _ in self._threads:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def snapshot(self) -> dict:
+        return {
+            "candidateVersion": self.candidate_version,
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "queued": self._queue.qsize(),
+        }
+
+
+def _histogram_percentile(histogram: Dict[str, int], q: float) -> Optional[float]:
+    """Upper bound (ms) of the bin holding the ``q`` quantile"""
+    counts = [histogram.get(str(i), 0) for i in range(len(LATENCY_BINS_MS))]
+    total = sum(counts)
+    if not total:
+        return None
+    running = 0
+    for upper, count in zip(LATENCY_BINS_MS, counts):
+        running += count
+        if running >= q * total:
+            return None if math.isinf(upper) else upper
+    return None
+
+
+def summarize(docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine hourly documents into agreement, confusion matrix and latency stats"""
+    count = agree = 0
+    prob_l1 = 0.0
+    confusion = [[0] * len(PROBABILITY_KEYS) for _ in PROBABILITY_KEYS]
+    latency_sums = {"primary": 0.0, "candidate": 0.0}
+    histograms: Dict[str, Dict[str, int]] = {"primary": {}, "candidate": {}}
+    primary_versions = set()
+    for doc in docs:
+        count += doc.get("count", 0)
+        agree += doc.get("agree", 0)
+        prob_l1 += doc.get("probL1", 0.0)
+        primary_versions.add(doc.get("primaryVersion"))
+        for cell, n in doc.get("confusion", {}).items():
+            primary_class, candidate_class = (int(c) for c in cell.split("_"))
+            confusion[primary_class][candidate_class] += n
+        for model in latency_sums:
+            latency_sums[model] += doc.get("latencyMs", {}).get(model, 0.0)
+            for bin_index, n in doc.get("latencyHist", {}).get(model, {}).items():
+                histograms[model][bin_index] = histograms[model].get(bin_index, 0) + n
+
+    return {
+        "count": count,
+        "agreementRate": round(agree / count, 4) if count else None,
+        "meanProbabilityL1": round(prob_l1 / count, 4) if count else None,
+        # Rows: live model's class, columns: candidate's class (Low, Medium, High)
+        "confusion": confusion,
+        "latencyMs": {
+            model: {
+                "mean": round(latency_sums[model] / count, 4) if count else None,
+                "p50": _histogram_percentile(histograms[model], 0.5),
+                "p95": _histogram_percentile(histograms[model], 0.95),
+            }
+            for model in latency_sums
+        },
+        "primaryVersions": sorted(v for v in primary_versions if v),
+    }
+
+
+def get_comparison(db, candidate_version: Optional[str] = None, since: Optional[datetime] = None) -> Dict[str, Any]:
+    """Comparison summary per candidate version, optionally since a time"""
+    query: Dict[str, Any] = {}
+    if candidate_version:
+        query["candidateVersion"] = candidate_version
+    if since is not None:
+        query["bucket"] = {"$gte": bucket_start(since, SHADOW_BUCKET_SECONDS)}
+
+    by_version: Dict[str, List[Dict[str, Any]]] = {}
+    for doc in db[COLLECTION].find(query, {"_id": 0}):
+        by_version.setdefault(doc["candidateVersion"], []).append(doc)
+    return {version: summarize(docs) for version, docs in by_version.items()}
@@ -0,0 +1,151 @@
+"""
+Real-time submission feed for teachers
+
+Tails a change stream on ``quiz_submissions`` filtered server-side by
+department (and optionally status) and turns each change into a compact
+Server-Sent Event. The SSE event id is the change stream resume token, so a
+reconnecting EventSource (Last-Event-ID) resumes exactly where it left off.
+Insert events carry every field a dashboard row shows, so clients add new
+submissions from the event instead of re-reading the list.
+
+A resume token the server can no longer honour (oplog rolled over, or a
+malformed id) does not fail the stream: it restarts from now and first
+sends a ``reset`` event with an empty id, which clears the client's
+Last-Event-ID and tells it to reload the list once.
+
+Change streams need a replica set or sharded cluster; the route checks
+supports_change_streams() before streaming and answers 503 otherwise.
+"""
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Idle time before try_next() returns and a keep-alive comment is sent
+HEARTBEAT_MS = 15000
+
+# Fields of the full document shipped in each event
+FEED_FIELDS = ["userId", "userName", "department", "status", "score", "submittedAt", "reviewedAt", "completedAt"]
+
+# Further fields shipped with inserts only: the rest of a dashboard row and its detail view
+INSERT_FIELDS = [
+    "userEmail",
+    "correctAnswers",
+    "totalQuestions",
+    "skillPerformance",
+    "strengths",
+    "weaknesses",
+    "teacherComments",
+    "mlPrediction",
+]
+
+
+async def supports_change_streams(database) -> bool:
+    """Whether the deployment behind an async database is a replica set or mongos"""
+    hello = await database.command("hello")
+    return bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+
+
+def build_pipeline(department: Optional[str], status: Optional[str]) -> List[Dict[str, Any]]:
+    """Change stream pipeline: inserts and updates matching the teacher's filter, projected small"""
+    match: Dict[str, Any] = {"operationType": {"$in": ["insert", "update", "replace"]}}
+    if department:
+        match["fullDocument.department"] = department
+    if status:
+        match["fullDocument.status"] = status
+
+    project: Dict[str, Any] = {
+        "operationType": 1,
+        "documentKey": 1,
+        # Only the names of changed fields, not their (possibly large) values
+        "changedFields": {
+            "$map": {
+                "input": {"$objectToArray": "$updateDescription.updatedFields"},
+                "in": "$$this.k",
+            }
+        },
+    }
+    for field in FEED_FIELDS:
+        project[f"fullDocument.{field}"] = 1
+    project["fullDocument.riskLabel"] = "$fullDocument.mlPrediction.risk_label"
+    project["row"] = {
+        "$cond": {
+            "if": {"$eq": ["$operationType", "insert"]},
+            "then": {field: f"$fullDocument.{field}" for field in INSERT_FIELDS},
+            "else": "$$REMOVE",
+        }
+    }
+    return [{"$match": match}, {"$project": project}]
+
+
+def to_event(change: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact delta for one change"""
+    document = change.get("fullDocument") or {}
+    event = {
+        "op": "insert" if change["operationType"] == "insert" else "update",
+        "submissionId": change["documentKey"]["_id"],
+        "riskLabel": document.get("riskLabel"),
+    }
+    for field in FEED_FIELDS:
+        event[field] = document.get(field)
+    if event["op"] == "insert":
+        event.update(change.get("row") or {})
+    else:
+        event["changedFields"] = sorted(change.get("changedFields") or [])
+    return event
+
+
+def format_sse(event: Dict[str, Any], event_id: Optional[str], encode, name: str = "submission") -> str:
+    lines = []
+    if event_id is not None:
+        # An empty id resets the client's Last-Event-ID
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {name}")
+    lines.append(f"data: {encode(event)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream_submission_events(
+    collection,
+    department: Optional[str],
+    status: Optional[str],
+    resume_token: Optional[str],
+    is_disconnected,
+    encode=json.dumps,
+) -> AsyncIterator[str]:
+    """
+    Yield SSE frames for changes on an async (AsyncMongoClient) collection
+
+    ``resume_token`` is the ``_data`` string from a previous event id.
+    """
+    from pymongo.errors import OperationFailure
+
+    pipeline = build_pipeline(department, status)
+    reset = False
+    try:
+        stream = await collection.watch(
+            pipeline,
+            full_document="updateLookup",
+            resume_after={"_data": resume_token} if resume_token else None,
+            max_await_time_ms=HEARTBEAT_MS,
+        )
+    except OperationFailure as e:
+        if not resume_token:
+            raise
+        logger.info("Resume token rejected (%s); restarting the feed from now", e.code)
+        stream = await collection.watch(pipeline, full_document="updateLookup", max_await_time_ms=HEARTBEAT_MS)
+        reset = True
+
+    async with stream:
+        yield "retry: 3000\n\n"
+        if reset:
+            yield format_sse({"reason": "resume_token_expired"}, "", encode, name="reset")
+        while stream.alive:
+            if await is_disconnected():
+                break
+            change = await stream.try_next()
+            if change is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(to_event(change), change["_id"].get("_data"), encode)
@@ -0,0 +1,382 @@
+"""
+Request-scoped span tracing with W3C trace context
+
+TracingMiddleware starts a server span per HTTP request, continuing the
+caller's trace when a valid ``traceparent`` header is sent, and returns the
+request's own ``traceparent`` in the response so a slow request can be
+looked up by its trace id. The active span lives in a contextvar, so it
+follows the request through async code, FastAPI's threadpool and
+asyncio.to_thread; stages open child spans with ``span()`` / ``@traced``
+and Mongo commands are recorded by MongoCommandTracer.
+
+Configuration (settings / environment):
+
+    TRACE_EXPORTER       "none" (default), "file" or "otlp"
+    TRACE_SAMPLE_RATE    fraction of new traces recorded (default 0.1);
+                         an incoming sampled flag is always honoured
+    TRACE_FILE           OTLP/JSON lines written by the file exporter
+    TRACE_OTLP_ENDPOINT  OTLP/HTTP JSON collector (default http://localhost:4318/v1/traces)
+
+Unsampled requests still get trace ids for propagation and log correlation
+but record nothing. Finished spans are exported in batches by a background
+thread, never on the request path.
+"""
+import functools
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from pymongo import monitoring
+
+from settings import settings
+
+TRACE_EXPORTER = settings.trace_exporter
+TRACE_SAMPLE_RATE = settings.trace_sample_rate
+TRACE_FILE = settings.trace_file
+TRACE_OTLP_ENDPOINT = settings.trace_otlp_endpoint
+
+SERVICE_NAME = "iml-server"
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+EXPORT_BATCH_SIZE = 512
+EXPORT_INTERVAL_SECONDS = 2.0
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """A timed operation; only sampled spans are recorded and exported"""
+
+    __slots__ = ("name", "kind", "trace_id", "span_id", "parent_id", "sampled",
+                 "start_ns", "end_ns", "attributes", "status", "status_message")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool, kind: int = KIND_INTERNAL):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: Dict[str, Any] = {}
+        self.status = 0
+        self.status_message = ""
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key: str, value: Any):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def record_exception(self, error: BaseException):
+        if self.sampled:
+            from logging_config import redact
+
+            self.status = STATUS_ERROR
+            self.status_message = redact(str(error))
+            self.attributes["exception.type"] = type(error).__name__
+
+    def end(self):
+        if self.end_ns:
+            return
+        self.end_ns = time.time_ns()
+        if self.sampled:
+            _exporter.submit(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        entry = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status or STATUS_OK},
+        }
+        if self.parent_id:
+            entry["parentSpanId"] = self.parent_id
+        if self.status_message:
+            entry["status"]["message"] = self.status_message
+        return entry
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    active = _current_span.get()
+    return active.trace_id if active is not None else None
+
+
+def parse_traceparent(header: Optional[str]):
+    """(trace_id, parent_span_id, sampled) from a W3C traceparent header, or None"""
+    if not header:
+        return None
+    match = _TRACEPARENT.match(header.strip().lower())
+    if not match:
+        return None
+    trace_id, span_id, flags = match.groups()
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+def _should_sample(trace_id: str, parent_sampled: Optional[bool]) -> bool:
+    if TRACE_EXPORTER == "none":
+        return False
+    if parent_sampled is not None:
+        return parent_sampled
+    # Deterministic on the trace id, like OpenTelemetry's TraceIdRatioBased
+    return int(trace_id[16:], 16) < TRACE_SAMPLE_RATE * (1 << 64)
+
+
+def start_request_span(name: str, traceparent: Optional[str] = None) -> Span:
+    """Root (server) span of a request, continuing the caller's trace if any"""
+    parent = parse_traceparent(traceparent)
+    if parent is None:
+        trace_id = secrets.token_hex(16)
+        return Span(name, trace_id, None, _should_sample(trace_id, None), KIND_SERVER)
+    trace_id, parent_id, sampled = parent
+    return Span(name, trace_id, parent_id, _should_sample(trace_id, sampled), KIND_SERVER)
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, **attributes):
+    """Child span of the active span; a no-op outside sampled requests"""
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        yield None
+        return
+    child = Span(name, parent.trace_id, parent.span_id, True, kind)
+    child.attributes.update(attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+def traced(name: str, kind: int = KIND_INTERNAL):
+    """Decorator running a (sync) function inside ``span(name)``"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, kind):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the server span and echoing ``traceparent``"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for key, value in scope.get("headers", ()):
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        root = start_request_span(f"{scope['method']} {scope['path']}", traceparent)
+        root.set_attribute("http.request.method", scope["method"])
+        root.set_attribute("url.path", scope["path"])
+        token = _current_span.set(root)
+
+        async def send_with_traceparent(message):
+            if message["type"] == "http.response.start":
+                root.set_attribute("http.response.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.status = STATUS_ERROR
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"traceparent", root.traceparent.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_traceparent)
+        except BaseException as e:
+            root.record_exception(e)
+            raise
+        finally:
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                root.name = f"{scope['method']} {route.path}"
+                root.set_attribute("http.route", route.path)
+            _current_span.reset(token)
+            root.end()
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """pymongo CommandListener recording each command as a client span"""
+
+    def __init__(self):
+        self._pending: Dict[tuple, Span] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(event) -> tuple:
+        return (event.connection_id, event.request_id)
+
+    def started(self, event):
+        parent = _current_span.get()
+        if parent is None or not parent.sampled:
+            return
+        child = Span(f"mongo.{event.command_name}", parent.trace_id, parent.span_id, True, KIND_CLIENT)
+        child.attributes["db.system"] = "mongodb"
+        child.attributes["db.name"] = event.database_name
+        child.attributes["db.operation"] = event.command_name
+        collection = event.command.get(event.command_name)
+        if isinstance(collection, str):
+            child.attributes["db.mongodb.collection"] = collection
+        with self._lock:
+            self._pending[self._key(event)] = child
+
+    def _finish(self, event, error: Optional[str] = None):
+        with self._lock:
+            child = self._pending.pop(self._key(event), None)
+        if child is None:
+            return
+        if error is not None:
+            child.status = STATUS_ERROR
+            child.status_message = error
+        child.end()
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure.get("errmsg", "command failed")))
+
+
+class _BatchExporter:
+    """Buffers finished spans and writes them from a background thread"""
+
+    def __init__(self):
+        self._queue: "queue.SimpleQueue[Optional[Span]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def submit(self, finished: Span):
+        # Started lazily (and again after fork) so every worker has its own thread
+        if self._pid != os.getpid():
+            self._start()
+        self._queue.put(finished)
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.SimpleQueue()
+            self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch: List[Span] = []
+            deadline = time.monotonic() + EXPORT_INTERVAL_SECONDS
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    export(batch)
+                except Exception as e:
+                    logger.warning("Span export failed: %s", e)
+
+    def shutdown(self, timeout: float = 5.0):
+        """Flush buffered spans (lifespan shutdown)"""
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+        self._thread = None
+        self._pid = None
+
+
+def _otlp_payload(batch: List[Span]) -> Dict[str, Any]:
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [s.to_otlp() for s in batch]}],
+        }]
+    }
+
+
+def export(batch: List[Span]):
+    """Write one batch to the configured exporter"""
+    payload = _otlp_payload(batch)
+    if TRACE_EXPORTER == "file":
+        os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+        with open(TRACE_FILE, "a") as f:
+            f.write(json.dumps(payload) + "\n")
+    elif TRACE_EXPORTER == "otlp":
+        import requests
+
+        response = requests.post(TRACE_OTLP_ENDPOINT, json=payload, timeout=5)
+        response.raise_for_status()
+
+
+_exporter = _BatchExporter()
+
+
+def shutdown_tracing():
+    _exporter.shutdown()
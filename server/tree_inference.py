@@ -0,0 +1,171 @@
+"""
+Flattened-array inference for tree models
+
+Compiles a trained scikit-learn DecisionTreeClassifier or RandomForestClassifier
+into contiguous NumPy arrays (feature, threshold, left, right, value) and walks
+them directly, skipping sklearn's per-call input validation and dispatch.
+Outputs match the source estimator's predict / predict_proba exactly.
+"""
+import numpy as np
+from typing import Any, List, Sequence
+
+LEAF = -1
+
+
+class CompiledTreeModel:
+    """
+    Tree ensemble stored as flat node arrays.
+
+    All trees are concatenated into one set of arrays; ``roots[i]`` is the index
+    of the i-th tree's root node. Child indices are global (already offset).
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, classes):
+        self.feature = np.ascontiguousarray(feature, dtype=np.intp)
+        self.threshold = np.ascontiguousarray(threshold, dtype=np.float64)
+        self.left = np.ascontiguousarray(left, dtype=np.intp)
+        self.right = np.ascontiguousarray(right, dtype=np.intp)
+        self.value = np.ascontiguousarray(value, dtype=np.float64)
+        self.roots = np.ascontiguousarray(roots, dtype=np.intp)
+        self.classes_ = np.asarray(classes)
+        self.n_trees = len(self.roots)
+
+        # Plain Python lists make single-row traversal much cheaper than
+        # indexing NumPy scalars one node at a time.
+        self._feature_list = self.feature.tolist()
+        self._threshold_list = self.threshold.tolist()
+        self._left_list = self.left.tolist()
+        self._right_list = self.right.tolist()
+        self._roots_list = self.roots.tolist()
+
+    def _leaves_one(self, row: Sequence[float]) -> List[int]:
+        """Return the leaf index reached in every tree for a single row"""
+        feature = self._feature_list
+        threshold = self._threshold_list
+        left = self._left_list
+        right = self._right_list
+
+        leaves = []
+        for node in self._roots_list:
+            while left[node] != LEAF:
+                if row[feature[node]] <= threshold[node]:
+                    node = left[node]
+                else:
+                    node = right[node]
+            leaves.append(node)
+        return leaves
+
+    def _leaves_batch(self, X: np.ndarray) -> np.ndarray:
+        """Return an (n_trees, n_rows) array of leaf indices, advancing all rows level by level"""
+        n_rows = X.shape[0]
+        rows = np.arange(n_rows)
+        leaves = np.empty((self.n_trees, n_rows), dtype=np.intp)
+        for t, root in enumerate(self._roots_list):
+            node = np.full(n_rows, root, dtype=np.intp)
+            active = self.left[node] != LEAF
+            while active.any():
+                idx = node[active]
+                go_left = X[rows[active], self.feature[idx]] <= self.threshold[idx]
+                node[active] = np.where(go_left, self.left[idx], self.right[idx])
+                active = self.left[node] != LEAF
+            leaves[t] = node
+        return leaves
+
+    def predict_proba_one(self, row: Sequence[float]) -> np.ndarray:
+        """Class probabilities for a single feature vector"""
+        # sklearn evaluates splits on float32 inputs; round the row the same way
+        row = np.asarray(row, dtype=np.float32).tolist()
+        leaves = self._leaves_one(row)
+        proba = self.value[leaves[0]].copy()
+        for leaf in leaves[1:]:
+            proba += self.value[leaf]
+        if self.n_trees > 1:
+            proba /= self.n_trees
+        return proba
+
+    def predict_proba(self, X) -> np.ndarray:
+        """Class probabilities for a 2D batch of feature vectors"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[0] == 1:
+            return self.predict_proba_one(X[0]).reshape(1, -1)
+
+        leaves = self._leaves_batch(X)
+        proba = self.value[leaves[0]].copy()
+        for t in range(1, self.n_trees):
+            proba += self.value[leaves[t]]
+        if self.n_trees > 1:
+            proba /= self.n_trees
+        return proba
+
+    def predict(self, X) -> np.ndarray:
+        """Predicted class labels for a 2D batch of feature vectors"""
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+def _leaf_values_are_fractions() -> bool:
+    """scikit-learn >= 1.4 stores per-node class fractions instead of weighted counts"""
+    import sklearn
+
+    major, minor = (int(part) for part in sklearn.__version__.split(".")[:2])
+    return (major, minor) >= (1, 4)
+
+
+def _tree_arrays(tree, fractions: bool) -> tuple:
+    """Extract node arrays from a fitted sklearn ``Tree``, normalising leaf values like predict_proba"""
+    value = tree.value[:, 0, :].astype(np.float64)
+    if not fractions:
+        normalizer = value.sum(axis=1, keepdims=True)
+        normalizer[normalizer == 0.0] = 1.0
+        value = value / normalizer
+    return (
+        tree.feature,
+        tree.threshold,
+        tree.children_left,
+        tree.children_right,
+        value,
+    )
+
+
+def compile_tree_model(model: Any) -> CompiledTreeModel:
+    """
+    Compile a fitted DecisionTreeClassifier or RandomForestClassifier
+
+    Only single-output classifiers are supported.
+    """
+    if hasattr(model, "estimators_"):
+        estimators = list(model.estimators_)
+    elif hasattr(model, "tree_"):
+        estimators = [model]
+    else:
+        raise TypeError(f"Cannot compile model of type {type(model).__name__}")
+
+    if getattr(model, "n_outputs_", 1) != 1:
+        raise ValueError("Only single-output tree models can be compiled")
+
+    fractions = _leaf_values_are_fractions()
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in estimators:
+        feature, threshold, left, right, value = _tree_arrays(estimator.tree_, fractions)
+        left = np.where(left == LEAF, LEAF, left + offset)
+        right = np.where(right == LEAF, LEAF, right + offset)
+
+        features.append(feature)
+        thresholds.append(threshold)
+        lefts.append(left)
+        rights.append(right)
+        values.append(value)
+        roots.append(offset)
+        offset += len(feature)
+
+    return CompiledTreeModel(
+        feature=np.concatenate(features),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts),
+        right=np.concatenate(rights),
+        value=np.concatenate(values),
+        roots=roots,
+        classes=model.classes_,
+    )